@@ -0,0 +1,157 @@
+import bisect
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from snapshots import Opportunity
+
+
+def bookmaker_id(bookmaker_key: str, bookmaker: str) -> str:
+    """Chave da casa (ou o nome em minúsculas, se a chave não veio)"""
+    return bookmaker_key or bookmaker.lower()
+
+
+def sport_group(sport_key: str) -> str:
+    """Grupo do esporte (ex.: soccer_epl -> soccer)"""
+    return sport_key.split('_', 1)[0]
+
+
+class AlertFilter(NamedTuple):
+    """Preferências de alerta de um usuário; conjuntos vazios aceitam qualquer valor"""
+    min_margin: float = 0.0
+    sports: FrozenSet[str] = frozenset()  # Chaves (basketball_nba) ou grupos (soccer)
+    bookmakers: FrozenSet[str] = frozenset()  # Todas as apostas precisam estar nessas casas
+    min_stake: float = 0.0  # Menor aposta aceita, no investimento base
+
+    def matches(self, opp: Opportunity) -> bool:
+        if opp.profit_margin < self.min_margin:
+            return False
+        if self.sports and opp.sport_key not in self.sports and sport_group(opp.sport_key) not in self.sports:
+            return False
+        if self.bookmakers and any(
+            bookmaker_id(bet.bookmaker_key, bet.bookmaker) not in self.bookmakers for bet in opp.bets
+        ):
+            return False
+        return not self.min_stake or min_stake(opp) >= self.min_stake
+
+
+def min_stake(opp: Opportunity) -> float:
+    return min((bet.stake for bet in opp.bets), default=0.0)
+
+
+class _Floors:
+    """Limites mínimos ordenados: quem aceita um valor é um prefixo da lista"""
+
+    def __init__(self):
+        self.values: List[Tuple[float, int]] = []
+
+    def add(self, value: float, chat_id: int) -> None:
+        bisect.insort(self.values, (value, chat_id))
+
+    def remove(self, value: float, chat_id: int) -> None:
+        index = bisect.bisect_left(self.values, (value, chat_id))
+        if index < len(self.values) and self.values[index] == (value, chat_id):
+            del self.values[index]
+
+    def accepting(self, value: float) -> int:
+        """Quantos chats têm limite <= value"""
+        return bisect.bisect_right(self.values, (value, float('inf')))
+
+    def chats(self, count: int) -> Iterator[int]:
+        return (chat_id for _, chat_id in self.values[:count])
+
+
+class AlertIndex:
+    """Índice invertido dos filtros dos inscritos
+
+    match() parte da dimensão mais seletiva (margem, aposta mínima, esporte ou casa de
+    cada aposta) e intersecta as demais como conjuntos, então o custo acompanha o número
+    de inscritos que podem receber o alerta e não o total de inscritos.
+    """
+
+    def __init__(self):
+        self.filters: Dict[int, AlertFilter] = {}
+        self._margins = _Floors()
+        self._stakes = _Floors()
+        self._by_sport: Dict[str, Set[int]] = defaultdict(set)
+        self._any_sport: Set[int] = set()
+        self._by_bookmaker: Dict[str, Set[int]] = defaultdict(set)
+        self._any_bookmaker: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self.filters)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self.filters
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self.filters))
+
+    def add(self, chat_id: int, alert_filter: Optional[AlertFilter] = None) -> None:
+        """Inscreve o chat (ou troca o filtro de um inscrito)"""
+        self.discard(chat_id)
+        alert_filter = alert_filter or AlertFilter()
+        self.filters[chat_id] = alert_filter
+        self._margins.add(alert_filter.min_margin, chat_id)
+        self._stakes.add(alert_filter.min_stake, chat_id)
+        for sport in alert_filter.sports:
+            self._by_sport[sport].add(chat_id)
+        if not alert_filter.sports:
+            self._any_sport.add(chat_id)
+        for bookmaker in alert_filter.bookmakers:
+            self._by_bookmaker[bookmaker].add(chat_id)
+        if not alert_filter.bookmakers:
+            self._any_bookmaker.add(chat_id)
+
+    def discard(self, chat_id: int) -> None:
+        alert_filter = self.filters.pop(chat_id, None)
+        if alert_filter is None:
+            return
+        self._margins.remove(alert_filter.min_margin, chat_id)
+        self._stakes.remove(alert_filter.min_stake, chat_id)
+        for sport in alert_filter.sports:
+            self._discard_posting(self._by_sport, sport, chat_id)
+        self._any_sport.discard(chat_id)
+        for bookmaker in alert_filter.bookmakers:
+            self._discard_posting(self._by_bookmaker, bookmaker, chat_id)
+        self._any_bookmaker.discard(chat_id)
+
+    @staticmethod
+    def _discard_posting(postings: Dict[str, Set[int]], value: str, chat_id: int) -> None:
+        chats = postings.get(value)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del postings[value]
+
+    def match(self, opp: Opportunity) -> List[int]:
+        """Chats inscritos cujo filtro aceita a oportunidade"""
+        if not self.filters:
+            return []
+        stake = min_stake(opp)
+        margin_count = self._margins.accepting(opp.profit_margin)
+        stake_count = self._stakes.accepting(stake)
+
+        # Esporte e cada aposta viram uniões de conjuntos ("qualquer" + postings)
+        unions = [[self._any_sport, self._by_sport.get(opp.sport_key, set()),
+                   self._by_sport.get(sport_group(opp.sport_key), set())]]
+        for bet in opp.bets:
+            unions.append([self._any_bookmaker,
+                           self._by_bookmaker.get(bookmaker_id(bet.bookmaker_key, bet.bookmaker), set())])
+        unions.sort(key=lambda parts: sum(len(part) for part in parts))
+
+        # Parte da dimensão mais seletiva; as interseções seguintes rodam em C
+        if min(margin_count, stake_count) < sum(len(part) for part in unions[0]):
+            floors = self._margins if margin_count <= stake_count else self._stakes
+            candidates = set(floors.chats(min(margin_count, stake_count)))
+        else:
+            candidates = set().union(*unions.pop(0))
+        for parts in unions:
+            if not candidates:
+                return []
+            candidates = set().union(*(candidates & part for part in parts))
+
+        filters = self.filters
+        return [
+            chat_id for chat_id in candidates
+            if filters[chat_id].min_margin <= opp.profit_margin and filters[chat_id].min_stake <= stake
+        ]
@@ -0,0 +1,429 @@
+import bisect
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy é opcional: só o motor vetorizado precisa dele
+    np = None
+
+from scheduler import parse_iso
+
+logger = logging.getLogger(__name__)
+
+TOTAL_INVESTMENT = 100  # Base de R$ 100
+SUPPORTED_MARKETS = ('h2h', 'spreads', 'totals')
+
+
+def is_stale(bookmaker: Dict, max_leg_age: Optional[float], now: float) -> bool:
+    """Se a cotação da casa é mais antiga que max_leg_age segundos (sem data: aceita)"""
+    if max_leg_age is None:
+        return False
+    updated = parse_iso(bookmaker.get('last_update', ''))
+    return updated is not None and now - updated.timestamp() > max_leg_age
+
+
+def outcome_line(game: Dict, market_key: str, outcome: Dict) -> Tuple[Optional[float], str]:
+    """Linha da cotação (None no h2h) e o rótulo do resultado"""
+    name = outcome['name']
+    if market_key == 'h2h':
+        return None, name
+
+    point = float(outcome['point'])
+    if market_key == 'spreads':
+        # Normalizado pelo mandante: Casa -1.5 e Visitante +1.5 são a mesma linha
+        line = -point if name == game.get('away_team') else point
+        return line, f"{name} {point:+g}"
+    return point, f"{name} {point:g}"
+
+
+def calculate_arbitrage_python(odds_data: List[Dict], min_profit_margin: float,
+                               max_leg_age: Optional[float] = None,
+                               now: Optional[float] = None) -> List[Dict]:
+    """Calcula oportunidades de arbitragem"""
+    arbitrage_opportunities = []
+    now = time.time() if now is None else now
+
+    for game in odds_data:
+        try:
+            bookmakers = game.get('bookmakers', [])
+            if len(bookmakers) < 2:
+                continue
+
+            # Organizar odds por (mercado, linha) e resultado
+            lines = {}
+            for bookmaker in bookmakers:
+                if is_stale(bookmaker, max_leg_age, now):
+                    continue  # Cotação antiga: provavelmente já mudou na casa
+                bookie_name = bookmaker['title']
+                markets = bookmaker.get('markets', [])
+
+                for market in markets:
+                    market_key = market['key']
+                    if market_key not in SUPPORTED_MARKETS:
+                        continue
+
+                    for outcome in market['outcomes']:
+                        line, outcome_name = outcome_line(game, market_key, outcome)
+                        price = float(outcome['price'])
+
+                        outcomes = lines.setdefault((market_key, line), {})
+                        if outcome_name not in outcomes:
+                            outcomes[outcome_name] = []
+
+                        outcomes[outcome_name].append({
+                            'bookmaker': bookie_name,
+                            'bookmaker_key': bookmaker.get('key', ''),
+                            'last_update': bookmaker.get('last_update', ''),
+                            'odds': price
+                        })
+
+            game_opportunities = []
+            for (market_key, line), outcomes in lines.items():
+                # Encontrar melhores odds para cada resultado
+                if len(outcomes) < 2:
+                    continue
+
+                best_odds = {}
+                for outcome_name, odds_list in outcomes.items():
+                    best_odd = max(odds_list, key=lambda x: x['odds'])
+                    best_odds[outcome_name] = best_odd
+
+                # Calcular se há arbitragem
+                implied_probabilities = []
+                total_investment = TOTAL_INVESTMENT
+
+                for outcome_name, best_odd in best_odds.items():
+                    implied_prob = 1 / best_odd['odds']
+                    implied_probabilities.append(implied_prob)
+
+                total_implied_prob = sum(implied_probabilities)
+
+                if total_implied_prob < 1.0:  # Há oportunidade de arbitragem
+                    profit_margin = ((1 / total_implied_prob) - 1) * 100
+
+                    if profit_margin >= min_profit_margin:
+                        # Calcular distribuição de apostas
+                        stakes = {}
+                        for outcome_name, best_odd in best_odds.items():
+                            stake_percentage = (1 / best_odd['odds']) / total_implied_prob
+                            stake_amount = total_investment * stake_percentage
+                            stakes[outcome_name] = {
+                                'bookmaker': best_odd['bookmaker'],
+                                'bookmaker_key': best_odd['bookmaker_key'],
+                                'last_update': best_odd['last_update'],
+                                'odds': best_odd['odds'],
+                                'stake': round(stake_amount, 2),
+                                'potential_return': round(stake_amount * best_odd['odds'], 2)
+                            }
+
+                        game_opportunities.append({
+                            'event_id': game.get('id', ''),
+                            'sport_key': game.get('sport_key', ''),
+                            'game': f"{game.get('home_team', 'Casa')} vs {game.get('away_team', 'Visitante')}",
+                            'sport': game.get('sport_title', 'Desconhecido'),
+                            'commence_time': game.get('commence_time', ''),
+                            'market': market_key,
+                            'point': line,
+                            'profit_margin': round(profit_margin, 2),
+                            'total_stake': total_investment,
+                            'guaranteed_profit': round(total_investment * (profit_margin / 100), 2),
+                            'bets': stakes
+                        })
+
+            arbitrage_opportunities.extend(game_opportunities)
+
+        except Exception as e:
+            logger.error(f"Erro ao calcular arbitragem: {e}")
+            continue
+
+    # Ordenar por margem de lucro
+    arbitrage_opportunities.sort(key=lambda x: x['profit_margin'], reverse=True)
+    return arbitrage_opportunities
+
+
+def calculate_arbitrage_numpy(odds_data: List[Dict], min_profit_margin: float,
+                              max_leg_age: Optional[float] = None,
+                              now: Optional[float] = None) -> List[Dict]:
+    """Calcula oportunidades de arbitragem com operações vetorizadas (linha x resultado x casa)
+
+    Cada linha da matriz é um (jogo, mercado, linha): o h2h do jogo, um handicap ou um total.
+    """
+    now = time.time() if now is None else now
+    lines = []  # (jogo, mercado, linha) de cada linha da matriz
+    outcome_names = []
+    bookmaker_names = []
+    bookmaker_info = []  # (chave, last_update) de cada coluna
+    quotes = []  # Sequência plana de (linha, resultado, casa, odd)
+
+    for game in odds_data:
+        mark = len(quotes)
+        try:
+            bookmakers = game.get('bookmakers', [])
+            if len(bookmakers) < 2:
+                continue
+
+            line_index = {}  # (mercado, linha) -> índice global da linha
+            outcome_index = []  # Por linha do jogo: resultado -> índice
+            names = []
+            info = []
+            for bookmaker in bookmakers:
+                if is_stale(bookmaker, max_leg_age, now):
+                    continue  # Cotação antiga: provavelmente já mudou na casa
+                column = len(names)
+                names.append(bookmaker['title'])
+                info.append((bookmaker.get('key', ''), bookmaker.get('last_update', '')))
+
+                for market in bookmaker.get('markets', []):
+                    market_key = market['key']
+                    if market_key not in SUPPORTED_MARKETS:
+                        continue
+
+                    for outcome in market['outcomes']:
+                        line, outcome_name = outcome_line(game, market_key, outcome)
+                        index = line_index.get((market_key, line))
+                        if index is None:
+                            index = line_index[(market_key, line)] = len(lines) + len(outcome_index)
+                            outcome_index.append({})
+                        rows = outcome_index[index - len(lines)]
+                        row = rows.setdefault(outcome_name, len(rows))
+                        quotes += (index, row, column, float(outcome['price']))
+        except Exception as e:
+            del quotes[mark:]
+            logger.error(f"Erro ao calcular arbitragem: {e}")
+            continue
+
+        # Linhas com um só resultado ficam na matriz, mas são mascaradas abaixo
+        for (market_key, line), rows in zip(line_index, outcome_index):
+            lines.append((game, market_key, line))
+            outcome_names.append(list(rows))
+            bookmaker_names.append(names)
+            bookmaker_info.append(info)
+
+    if not lines:
+        return []
+
+    # Matriz densa de odds; -inf onde a casa não cotou o resultado
+    n_outcomes = np.array([len(names) for names in outcome_names])
+    shape = (len(lines), int(n_outcomes.max()), max(len(names) for names in bookmaker_names))
+    quotes = np.array(quotes, dtype=float).reshape(-1, 4)
+    positions = tuple(quotes[:, :3].astype(np.intp).T)
+    prices = np.full(shape, -np.inf)
+    np.maximum.at(prices, positions, quotes[:, 3])
+
+    # Melhor odd de cada resultado (argmax mantém a primeira casa em caso de empate)
+    best_bookmaker = prices.argmax(axis=2)
+    best_odds = np.take_along_axis(prices, best_bookmaker[:, :, None], axis=2)[:, :, 0]
+    valid = np.arange(shape[1])[None, :] < n_outcomes[:, None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        implied = np.where(valid, 1 / np.where(valid, best_odds, 1.0), 0.0)
+
+        # Soma na mesma ordem do motor em Python para resultados idênticos
+        total_implied_prob = np.zeros(len(lines))
+        for column in range(shape[1]):
+            total_implied_prob += implied[:, column]
+
+        profit_margin = ((1 / total_implied_prob) - 1) * 100
+        is_arbitrage = (n_outcomes >= 2) & (total_implied_prob < 1.0) & (profit_margin >= min_profit_margin)
+
+        stake_amount = TOTAL_INVESTMENT * (implied / total_implied_prob[:, None])
+        potential_return = stake_amount * best_odds
+
+    arbitrage_opportunities = []
+    for index in np.flatnonzero(is_arbitrage).tolist():
+        game, market_key, line = lines[index]
+        bookmakers = bookmaker_names[index]
+        info = bookmaker_info[index]
+        margin = float(profit_margin[index])
+        odds_row = best_odds[index].tolist()
+        stake_row = stake_amount[index].tolist()
+        return_row = potential_return[index].tolist()
+        bookmaker_row = best_bookmaker[index].tolist()
+
+        stakes = {}
+        for column, outcome_name in enumerate(outcome_names[index]):
+            best = bookmaker_row[column]
+            stakes[outcome_name] = {
+                'bookmaker': bookmakers[best],
+                'bookmaker_key': info[best][0],
+                'last_update': info[best][1],
+                'odds': odds_row[column],
+                'stake': round(stake_row[column], 2),
+                'potential_return': round(return_row[column], 2)
+            }
+
+        arbitrage_opportunities.append({
+            'event_id': game.get('id', ''),
+            'sport_key': game.get('sport_key', ''),
+            'game': f"{game.get('home_team', 'Casa')} vs {game.get('away_team', 'Visitante')}",
+            'sport': game.get('sport_title', 'Desconhecido'),
+            'commence_time': game.get('commence_time', ''),
+            'market': market_key,
+            'point': line,
+            'profit_margin': round(margin, 2),
+            'total_stake': TOTAL_INVESTMENT,
+            'guaranteed_profit': round(TOTAL_INVESTMENT * (margin / 100), 2),
+            'bets': stakes
+        })
+
+    # Ordenar por margem de lucro
+    arbitrage_opportunities.sort(key=lambda x: x['profit_margin'], reverse=True)
+    return arbitrage_opportunities
+
+
+class _SportState:
+    """Estado incremental de um esporte"""
+
+    __slots__ = ('signatures', 'opportunities', 'ranking', 'rank_keys', 'untracked')
+
+    def __init__(self):
+        self.signatures: Dict[str, Optional[tuple]] = {}  # id do evento -> last_update das casas
+        self.opportunities: Dict[int, Dict] = {}  # ordem -> oportunidade
+        self.ranking: List[Tuple[float, int]] = []  # (-margem, ordem), sempre ordenada
+        self.rank_keys: Dict[str, List[Tuple[float, int]]] = {}  # id do evento -> suas linhas
+        self.untracked: List[Dict] = []  # Jogos sem id, recalculados sempre
+
+
+class IncrementalArbitrageEngine:
+    """Mantém o estado por jogo e recalcula só os jogos cujas cotações mudaram"""
+
+    def __init__(self, engine: Callable[..., List[Dict]] = calculate_arbitrage_python):
+        self.engine = engine
+        self.last_changed = 0
+        self.last_total = 0
+        self._sports: Dict[str, _SportState] = {}
+        self._settings: Optional[Tuple[float, Optional[float]]] = None
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(game: Dict, max_leg_age: Optional[float], now: float) -> Optional[tuple]:
+        """Assinatura do jogo pelo last_update de cada casa (None se não rastreável)
+
+        Com max_leg_age, a assinatura também muda quando uma casa fica antiga demais.
+        """
+        signature = [game.get('commence_time')]
+        for bookmaker in game.get('bookmakers', []):
+            last_update = bookmaker.get('last_update')
+            if last_update is None:
+                return None
+            signature.append((bookmaker.get('key') or bookmaker.get('title'), last_update,
+                              is_stale(bookmaker, max_leg_age, now)))
+        return tuple(signature)
+
+    def update(self, sport_key: str, odds_data: List[Dict], min_profit_margin: float,
+               max_leg_age: Optional[float] = None) -> List[Dict]:
+        """Aplica uma nova resposta da API e retorna as oportunidades do esporte"""
+        now = time.time()
+        with self._lock:
+            if (min_profit_margin, max_leg_age) != self._settings:
+                # Margem ou limite de idade mudou: todo o estado precisa ser recalculado
+                self._sports.clear()
+                self._settings = (min_profit_margin, max_leg_age)
+
+            state = self._sports.setdefault(sport_key, _SportState())
+            seen = set()
+            changed = []
+            untracked = []
+
+            for game in odds_data:
+                event_id = game.get('id')
+                if not event_id:
+                    untracked.append(game)
+                    continue
+
+                seen.add(event_id)
+                signature = self._signature(game, max_leg_age, now)
+                if (signature is not None and event_id in state.signatures
+                        and state.signatures[event_id] == signature):
+                    continue
+
+                state.signatures[event_id] = signature
+                changed.append(game)
+                self._remove(state, event_id)
+
+            # Jogos que saíram da API (começaram ou foram retirados)
+            for event_id in list(state.signatures):
+                if event_id not in seen:
+                    del state.signatures[event_id]
+                    self._remove(state, event_id)
+
+            if changed:
+                for opp in self.engine(changed, min_profit_margin, max_leg_age, now):
+                    self._insert(state, opp)
+
+            state.untracked = []
+            if untracked:
+                state.untracked = self.engine(untracked, min_profit_margin, max_leg_age, now)
+
+            self.last_changed = len(changed) + len(untracked)
+            self.last_total = len(odds_data)
+            logger.debug(f"{sport_key}: {self.last_changed}/{self.last_total} jogos recalculados")
+
+            return self._ranked(state)
+
+    def update_event(self, sport_key: str, game: Dict, min_profit_margin: float,
+                     max_leg_age: Optional[float] = None) -> None:
+        """Recalcula um evento assim que ele chega; update() com a lista completa vem depois"""
+        event_id = game.get('id')
+        if not event_id:
+            return
+        now = time.time()
+        with self._lock:
+            if self._settings is None:
+                self._settings = (min_profit_margin, max_leg_age)
+            elif (min_profit_margin, max_leg_age) != self._settings:
+                return  # O próximo update() recalcula tudo com as novas configurações
+
+            state = self._sports.setdefault(sport_key, _SportState())
+            signature = self._signature(game, max_leg_age, now)
+            if signature is None or state.signatures.get(event_id) == signature:
+                return
+
+            state.signatures[event_id] = signature
+            self._remove(state, event_id)
+            for opp in self.engine([game], min_profit_margin, max_leg_age, now):
+                self._insert(state, opp)
+
+    def _insert(self, state: _SportState, opp: Dict) -> None:
+        rank_key = (-opp['profit_margin'], next(self._order))
+        bisect.insort(state.ranking, rank_key)
+        state.rank_keys.setdefault(opp['event_id'], []).append(rank_key)
+        state.opportunities[rank_key[1]] = opp
+
+    def _remove(self, state: _SportState, event_id: str) -> None:
+        """Remove todas as oportunidades (mercados e linhas) do evento"""
+        for rank_key in state.rank_keys.pop(event_id, ()):
+            index = bisect.bisect_left(state.ranking, rank_key)
+            del state.ranking[index]
+            del state.opportunities[rank_key[1]]
+
+    @staticmethod
+    def _ranked(state: _SportState) -> List[Dict]:
+        ranked = [state.opportunities[order] for _, order in state.ranking]
+        if state.untracked:
+            ranked = list(heapq.merge(ranked, state.untracked, key=lambda x: -x['profit_margin']))
+        return ranked
+
+
+ENGINES = {
+    'python': calculate_arbitrage_python,
+    'numpy': calculate_arbitrage_numpy,
+}
+
+
+def get_engine(name: str) -> Callable[..., List[Dict]]:
+    """Retorna o motor de cálculo configurado (python ou numpy)"""
+    name = (name or 'python').lower()
+    if name not in ENGINES:
+        logger.warning(f"Motor de arbitragem desconhecido '{name}', usando python")
+        name = 'python'
+    if name == 'numpy' and np is None:
+        logger.warning("numpy não instalado, usando o motor python")
+        name = 'python'
+    return ENGINES[name]
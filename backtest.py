@@ -0,0 +1,310 @@
+"""Replay do histórico de odds gravado pelo bot, sem chamar a API.
+
+Uso:
+    python backtest.py --margins 0.5,1,2 --regions us,uk,eu --bookmakers all "bet365,betfair"
+"""
+import argparse
+import heapq
+import json
+import logging
+import math
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from arbitrage_engine import get_engine
+from odds_store import OddsStore
+from scheduler import parse_iso
+
+MARGIN_BUCKETS = (1.0, 2.0, 3.0, 5.0, 10.0)
+
+
+class Config(NamedTuple):
+    """Uma combinação da grade testada"""
+    min_profit_margin: float
+    regions: str  # '' = qualquer conjunto de regiões gravado
+    bookmakers: str  # 'all' ou chaves separadas por vírgula
+
+
+class Task(NamedTuple):
+    store_dirs: Tuple[str, ...]
+    engine: str
+    configs: Tuple[Config, ...]
+    max_leg_age: Optional[float]
+    sport_key: Optional[str]
+    start: Optional[float]
+    end: Optional[float]
+
+
+def store_dirs(path: str) -> Tuple[str, ...]:
+    """O histórico e os subdiretórios shard-N gravados pelos processos de varredura"""
+    shards = sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if name.startswith('shard-') and os.path.isdir(os.path.join(path, name))
+    ) if os.path.isdir(path) else []
+    return (path, *shards)
+
+
+def _same_regions(recorded: str, wanted: str) -> bool:
+    return not wanted or set(recorded.split(',')) == set(wanted.split(','))
+
+
+def _filter_bookmakers(games: List[Dict], bookmakers: str) -> List[Dict]:
+    if bookmakers == 'all':
+        return games
+    allowed = set(bookmakers.split(','))
+    return [
+        {**game, 'bookmakers': [b for b in game.get('bookmakers', []) if b.get('key') in allowed]}
+        for game in games
+    ]
+
+
+def _key(opp: Dict) -> Hashable:
+    legs = tuple(sorted((outcome, bet['bookmaker']) for outcome, bet in opp['bets'].items()))
+    return (opp.get('event_id') or opp['game'], opp['commence_time'], opp['market'], opp['point'], legs)
+
+
+class Edge(NamedTuple):
+    """Episódio que toca a borda de um pedaço e pode continuar no pedaço vizinho"""
+    first: float
+    last: float
+    margin: float
+    at_start: bool  # Já aberto no primeiro snapshot do pedaço
+    at_end: bool  # Ainda aberto no último snapshot do pedaço
+
+
+class Replay(NamedTuple):
+    """Resultado de um pedaço: episódios completos e os das bordas, por (configuração, esporte)"""
+    episodes: Dict[Config, List[Tuple[float, float]]]
+    edges: Dict[Tuple[Config, str], List[Tuple[Hashable, Edge]]]  # Presente se o pedaço teve snapshots
+
+
+def replay(task: Task) -> Replay:
+    """Reproduz um pedaço do histórico; retorna (duração, margem máxima) de cada oportunidade"""
+    engine = get_engine(task.engine)
+    stores = [OddsStore(path) for path in task.store_dirs]
+
+    # Configurações com as mesmas regiões e casas compartilham um único cálculo
+    groups: Dict[Tuple[str, str], List[Config]] = defaultdict(list)
+    for config in task.configs:
+        groups[(config.regions, config.bookmakers)].append(config)
+
+    episodes: Dict[Config, List[Tuple[float, float]]] = defaultdict(list)
+    open_: Dict[Tuple[Config, str], Dict[Hashable, List[float]]] = defaultdict(dict)
+    # Abertos no primeiro snapshot: podem ter começado no pedaço anterior
+    heads: Dict[Tuple[Config, str], Set[Hashable]] = {}
+    edges: Dict[Tuple[Config, str], List[Tuple[Hashable, Edge]]] = {}
+
+    # Um esporte pode ter sido gravado em mais de um diretório (ex.: mudança no número de shards)
+    snapshots = heapq.merge(
+        *(store.snapshots(task.sport_key, start=task.start, end=task.end) for store in stores),
+        key=lambda snapshot: snapshot.timestamp
+    )
+    for snapshot in snapshots:
+        for (regions, bookmakers), configs in groups.items():
+            if not _same_regions(snapshot.regions, regions):
+                continue
+
+            games = _filter_bookmakers(snapshot.games, bookmakers)
+            lowest = min(config.min_profit_margin for config in configs)
+            # Idade das cotações medida no momento em que foram gravadas
+            opportunities = engine(games, lowest, task.max_leg_age, snapshot.timestamp)
+
+            for config in configs:
+                current = {
+                    _key(opp): opp['profit_margin'] for opp in opportunities
+                    if opp['profit_margin'] >= config.min_profit_margin
+                }
+                state_key = (config, snapshot.sport_key)
+                state = open_[state_key]
+                if state_key not in heads:
+                    heads[state_key] = set(current)
+                    edges[state_key] = []
+                head = heads[state_key]
+                # Oportunidades que sumiram encerram o episódio
+                for key in [key for key in state if key not in current]:
+                    first, last, margin = state.pop(key)
+                    if key in head:
+                        head.discard(key)  # Se reaparecer, é um episódio novo
+                        edges[state_key].append((key, Edge(first, last, margin, True, False)))
+                    else:
+                        episodes[config].append((last - first, margin))
+                for key, margin in current.items():
+                    if key in state:
+                        state[key][1] = snapshot.timestamp
+                        state[key][2] = max(state[key][2], margin)
+                    else:
+                        state[key] = [snapshot.timestamp, snapshot.timestamp, margin]
+
+    for state_key, state in open_.items():
+        for key, (first, last, margin) in state.items():
+            edges[state_key].append((key, Edge(first, last, margin, key in heads[state_key], True)))
+    return Replay(dict(episodes), edges)
+
+
+def stitch(replays: Iterable[Replay]) -> Dict[Config, List[Tuple[float, float]]]:
+    """Junta os pedaços (na ordem de tempo de cada esporte) emendando os episódios das bordas
+
+    Um episódio aberto no fim de um pedaço continua no seguinte se também estiver aberto
+    no primeiro snapshot dele; assim o resultado não depende de quantos pedaços foram usados.
+    """
+    episodes: Dict[Config, List[Tuple[float, float]]] = defaultdict(list)
+    carry: Dict[Tuple[Config, str], Dict[Hashable, Edge]] = defaultdict(dict)
+
+    for result in replays:
+        for config, found in result.episodes.items():
+            episodes[config].extend(found)
+        for state_key, edges in result.edges.items():
+            config = state_key[0]
+            previous = carry.pop(state_key, {})
+            for key, edge in edges:
+                before = previous.pop(key, None) if edge.at_start else None
+                if before is not None:
+                    edge = edge._replace(first=before.first, margin=max(before.margin, edge.margin))
+                if edge.at_end:
+                    carry[state_key][key] = edge
+                else:
+                    episodes[config].append((edge.last - edge.first, edge.margin))
+            # Abertos no pedaço anterior e ausentes no primeiro snapshot deste: terminaram lá
+            for edge in previous.values():
+                episodes[config].append((edge.last - edge.first, edge.margin))
+
+    for (config, _), edges in carry.items():
+        for edge in edges.values():
+            episodes[config].append((edge.last - edge.first, edge.margin))
+    return dict(episodes)
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(config: Config, episodes: List[Tuple[float, float]]) -> Dict:
+    lifetimes = [lifetime for lifetime, _ in episodes]
+    margins = [margin for _, margin in episodes]
+    bounds = (0.0,) + MARGIN_BUCKETS + (math.inf,)
+    distribution = {
+        (f"{lower:g}-{upper:g}%" if upper != math.inf else f">={lower:g}%"):
+            sum(1 for margin in margins if lower <= margin < upper)
+        for lower, upper in zip(bounds, bounds[1:])
+    }
+
+    return {
+        'min_profit_margin': config.min_profit_margin,
+        'regions': config.regions or 'todas',
+        'bookmakers': config.bookmakers,
+        'opportunities': len(episodes),
+        'lifetime_p50_s': _percentile(lifetimes, 0.5) if lifetimes else 0.0,
+        'lifetime_p90_s': _percentile(lifetimes, 0.9) if lifetimes else 0.0,
+        'lifetime_max_s': max(lifetimes) if lifetimes else 0.0,
+        'margin_mean': sum(margins) / len(margins) if margins else 0.0,
+        'margin_distribution': distribution,
+    }
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        moment = parse_iso(value)
+        if moment is None:
+            raise argparse.ArgumentTypeError(f"Data inválida: {value}")
+        return moment.timestamp()
+
+
+def build_tasks(args: argparse.Namespace, configs: Tuple[Config, ...]) -> List[Task]:
+    """Divide o histórico por esporte ou em faixas de tempo iguais"""
+    paths = store_dirs(args.store)
+    stores = [OddsStore(path) for path in paths]
+    start, end = _parse_time(args.start), _parse_time(args.end)
+    sports = args.sports.split(',') if args.sports else sorted({
+        sport for store in stores for sport in store.sports()
+    })
+
+    if args.split == 'sport':
+        return [
+            Task(paths, args.engine, configs, args.max_leg_age, sport, start, end) for sport in sports
+        ]
+
+    tasks = []
+    for sport in sports:
+        ranges = [recorded for recorded in (store.time_range(sport) for store in stores) if recorded]
+        if not ranges:
+            continue
+        recorded = (min(first for first, _ in ranges), max(last for _, last in ranges))
+        first = start if start is not None else recorded[0]
+        last = end if end is not None else recorded[1]
+        step = (last - first) / args.chunks
+        if step <= 0:
+            tasks.append(Task(paths, args.engine, configs, args.max_leg_age, sport, first, last))
+            continue
+        for i in range(args.chunks):
+            chunk_end = last if i == args.chunks - 1 else math.nextafter(first + (i + 1) * step, -math.inf)
+            tasks.append(Task(paths, args.engine, configs, args.max_leg_age, sport,
+                              first + i * step, chunk_end))
+    return tasks
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Backtest de arbitragem sobre o histórico de odds")
+    parser.add_argument('--store', default=os.getenv('ODDS_STORE_DIR') or 'odds_history',
+                        help="Diretório do histórico gravado pelo bot (inclui os subdiretórios shard-N)")
+    parser.add_argument('--margins', default='1.0', help="Margens mínimas (%%), separadas por vírgula")
+    parser.add_argument('--regions', nargs='*', default=[''],
+                        help="Conjuntos de regiões gravados a considerar (ex.: us,uk,eu)")
+    parser.add_argument('--bookmakers', nargs='*', default=['all'],
+                        help="Conjuntos de casas (chaves separadas por vírgula, ou all)")
+    parser.add_argument('--sports', default='', help="Esportes (padrão: todos os gravados)")
+    parser.add_argument('--start', help="Início (ISO ou epoch)")
+    parser.add_argument('--end', help="Fim (ISO ou epoch)")
+    parser.add_argument('--engine', default=os.getenv('ARBITRAGE_ENGINE', 'python'))
+    parser.add_argument('--max-leg-age', type=float, default=None,
+                        help="Ignora cotações mais antigas que isso (segundos)")
+    parser.add_argument('--split', choices=('sport', 'time'), default='sport',
+                        help="Divide o trabalho por esporte ou por faixa de tempo")
+    parser.add_argument('--chunks', type=int, default=os.cpu_count() or 1,
+                        help="Faixas de tempo por esporte com --split time")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--json', action='store_true', help="Saída em JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING)
+
+    configs = tuple(
+        Config(float(margin), regions, bookmakers)
+        for margin in args.margins.split(',')
+        for regions in args.regions
+        for bookmakers in args.bookmakers
+    )
+    tasks = build_tasks(args, configs)
+
+    started = time.perf_counter()
+    episodes: Dict[Config, List[Tuple[float, float]]] = {config: [] for config in configs}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # map preserva a ordem das tarefas: os pedaços de cada esporte chegam em ordem de tempo
+        for config, found in stitch(pool.map(replay, tasks)).items():
+            episodes[config].extend(found)
+    elapsed = time.perf_counter() - started
+
+    results = [summarize(config, episodes[config]) for config in configs]
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+
+    print(f"{len(tasks)} tarefas em {elapsed:.1f}s com {args.workers} processos\n")
+    print(f"{'margem':>7} {'regiões':<12} {'casas':<24} {'oport.':>7} {'vida p50':>9} "
+          f"{'vida p90':>9} {'margem média':>13}  distribuição")
+    for result in results:
+        distribution = ' '.join(f"{label}:{count}" for label, count in result['margin_distribution'].items())
+        print(f"{result['min_profit_margin']:>6.2f}% {result['regions']:<12} {result['bookmakers'][:24]:<24} "
+              f"{result['opportunities']:>7} {result['lifetime_p50_s']:>8.0f}s {result['lifetime_p90_s']:>8.0f}s "
+              f"{result['margin_mean']:>12.2f}%  {distribution}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Benchmarks offline: gerador de odds sintéticas e servidor local no formato da The Odds API"""
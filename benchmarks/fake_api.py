@@ -0,0 +1,190 @@
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import generate_odds, generate_sports
+
+logger = logging.getLogger(__name__)
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return  # Cliente desistiu no meio da resposta (ex.: processo de varredura encerrado)
+        super().handle_error(request, client_address)
+
+
+class FakeOddsAPI:
+    """Servidor HTTP local que imita a The Odds API (latência e cota configuráveis)"""
+
+    def __init__(
+        self,
+        sports: Optional[List[Dict]] = None,
+        odds: Optional[Dict[str, List[Dict]]] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        quota: int = 500,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        **generator_options
+    ):
+        self.sports = sports if sports is not None else generate_sports()
+        self.odds = odds if odds is not None else {}
+        self._encoded: Dict[str, bytes] = {}
+        self.generator_options = generator_options
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_total = quota
+        self.used = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _QuietServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v4"
+
+    def odds_for(self, sport_key: str) -> List[Dict]:
+        """Odds de um esporte, geradas sob demanda na primeira consulta"""
+        with self._lock:
+            if sport_key not in self.odds:
+                self.odds[sport_key] = generate_odds(sport_key, seed=zlib.crc32(sport_key.encode()),
+                                                     **self.generator_options)
+            return self.odds[sport_key]
+
+    def event_for(self, sport_key: str, event_id: str) -> Optional[Dict]:
+        for game in self.odds_for(sport_key):
+            if game['id'] == event_id:
+                return game
+        return None
+
+    def encoded_odds(self, sport_key: str) -> bytes:
+        """Corpo JSON já serializado, para não medir o custo do próprio servidor"""
+        data = self.odds_for(sport_key)
+        with self._lock:
+            if sport_key not in self._encoded:
+                self._encoded[sport_key] = json.dumps(data).encode()
+            return self._encoded[sport_key]
+
+    def charge(self, cost: int) -> Dict[str, str]:
+        """Desconta a cota e retorna os cabeçalhos x-requests-*"""
+        with self._lock:
+            self.requests += 1
+            self.used += cost
+            remaining = max(0, self.quota_total - self.used)
+            return {
+                'x-requests-remaining': str(remaining),
+                'x-requests-used': str(self.used),
+                'x-requests-last': str(cost)
+            }
+
+    def start(self) -> 'FakeOddsAPI':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeOddsAPI':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, como a API real
+
+            def do_GET(self):
+                delay = api.latency + random.uniform(0, api.jitter)
+                if delay:
+                    time.sleep(delay)
+
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                parts = [p for p in url.path.split('/') if p]
+                if parts[:1] == ['v4']:
+                    parts = parts[1:]
+
+                if parts == ['sports']:
+                    self._reply(200, api.sports, api.charge(0))
+                elif len(parts) == 3 and parts[0] == 'sports' and parts[2] == 'odds':
+                    if api.used >= api.quota_total:
+                        self._reply(401, {'message': 'Usage quota has been reached'}, api.charge(0))
+                        return
+                    regions = len(params.get('regions', 'us').split(','))
+                    markets = len(params.get('markets', 'h2h').split(','))
+                    self._reply(200, api.encoded_odds(parts[1]), api.charge(regions * markets))
+                elif len(parts) == 5 and parts[0] == 'sports' and parts[2] == 'events' and parts[4] == 'odds':
+                    event = api.event_for(parts[1], parts[3])
+                    if event is None:
+                        self._reply(404, {'message': 'Event not found'}, api.charge(0))
+                        return
+                    # Cada grupo de até 10 casas conta como uma região
+                    allowed = {key for key in params.get('bookmakers', '').split(',') if key}
+                    bookmakers = [b for b in event['bookmakers'] if not allowed or b['key'] in allowed]
+                    markets = len(params.get('markets', 'h2h').split(','))
+                    cost = max(1, -(-len(allowed) // 10)) * markets
+                    self._reply(200, {**event, 'bookmakers': bookmakers}, api.charge(cost))
+                else:
+                    self._reply(404, {'message': 'Not found'}, {})
+
+            def _reply(self, status: int, body, headers: Dict[str, str]):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local no formato da The Odds API")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.1, help="Latência fixa por requisição (s)")
+    parser.add_argument('--jitter', type=float, default=0.05, help="Latência aleatória extra (s)")
+    parser.add_argument('--quota', type=int, default=500)
+    parser.add_argument('--games', type=int, default=50)
+    parser.add_argument('--bookmakers', type=int, default=8)
+    parser.add_argument('--outcomes', type=int, default=2)
+    parser.add_argument('--density', type=float, default=0.05, help="Fração de jogos com arbitragem")
+    args = parser.parse_args()
+
+    api = FakeOddsAPI(
+        latency=args.latency, jitter=args.jitter, quota=args.quota, port=args.port,
+        games=args.games, bookmakers=args.bookmakers, outcomes=args.outcomes,
+        arbitrage_density=args.density
+    )
+    print(f"Servindo em {api.url} (use THE_ODDS_API_URL={api.url})")
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+
+class _Bucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consome um envio; retorna 0 ou quantos segundos faltam para liberar"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class FakeBotAPI:
+    """Servidor HTTP local no formato da Bot API do Telegram, com limites de envio
+
+    Acima do limite global ou do limite do chat responde 429 com retry_after, como a API
+    real. Use com telegram.Bot(token, base_url=api.url).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: float = 3.0,
+        host: str = '127.0.0.1',
+        port: int = 0,
+    ):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.sent: Dict[str, int] = defaultdict(int)  # Chamadas aceitas por método
+        self.rejected = 0  # Respostas 429
+        self.deliveries: List[Tuple[float, int, str, str]] = []  # (momento, chat, método, texto)
+        self._global = _Bucket(global_rate, global_rate)
+        self._chats: Dict[int, _Bucket] = {}
+        self._message_ids = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def admit(self, chat_id: int) -> float:
+        """0 se o envio cabe nos limites; senão os segundos de espera exigidos"""
+        with self._lock:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                rate = self.group_rate if chat_id < 0 else self.chat_rate
+                bucket = self._chats[chat_id] = _Bucket(rate, self.chat_burst)
+            wait = max(bucket.take(), self._global.take())
+            if wait:
+                self.rejected += 1
+            return wait
+
+    def start(self) -> 'FakeBotAPI':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeBotAPI':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _message(self, chat_id: int, text: str, message_id: Optional[int] = None) -> Dict:
+        with self._lock:
+            if message_id is None:
+                self._message_ids += 1
+                message_id = self._message_ids
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'group' if chat_id < 0 else 'private'},
+            'text': text,
+        }
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                if api.latency:
+                    time.sleep(api.latency)
+
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode()
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(body or '{}')
+                else:
+                    params = {key: values[-1] for key, values in parse_qs(body).items()}
+                method = self.path.rstrip('/').rsplit('/', 1)[-1]
+
+                if method == 'getMe':
+                    self._result({'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'})
+                    return
+                if method == 'answerCallbackQuery':
+                    self._result(True)
+                    return
+                if method not in ('sendMessage', 'editMessageText'):
+                    self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                    return
+
+                chat_id = int(params.get('chat_id', 0))
+                wait = api.admit(chat_id)
+                if wait:
+                    retry_after = max(1, math.ceil(wait))
+                    self._reply(429, {
+                        'ok': False, 'error_code': 429,
+                        'description': f'Too Many Requests: retry after {retry_after}',
+                        'parameters': {'retry_after': retry_after},
+                    })
+                    return
+
+                text = params.get('text', '')
+                with api._lock:
+                    api.sent[method] += 1
+                    api.deliveries.append((time.monotonic(), chat_id, method, text))
+                message_id = int(params['message_id']) if 'message_id' in params else None
+                self._result(api._message(chat_id, text, message_id))
+
+            def _result(self, result):
+                self._reply(200, {'ok': True, 'result': result})
+
+            def _reply(self, status: int, body: Dict):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
@@ -0,0 +1,536 @@
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.fake_api import FakeOddsAPI
+from benchmarks.synthetic import generate_odds, generate_sports
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Percentil por vizinho mais próximo"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name: str, samples: List[float], peak_bytes: int) -> Dict:
+    result = {
+        'name': name,
+        'runs': len(samples),
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'peak_mb': peak_bytes / 1024 / 1024,
+    }
+    print(f"{name:<34} {result['runs']:>5} {result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} "
+          f"{result['peak_mb']:>10.2f}")
+    return result
+
+
+async def measure(name: str, iterations: int, fn: Callable[[], Awaitable[None]],
+                  setup: Callable[[], None] = lambda: None) -> Dict:
+    """Executa fn() várias vezes medindo latência e pico de memória alocada"""
+    samples = []
+    gc.collect()
+    for _ in range(iterations):
+        setup()
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+
+    # Memória medida numa execução à parte: o tracemalloc distorce a latência
+    setup()
+    tracemalloc.start()
+    await fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return report(name, samples, peak)
+
+
+class _FakeQuery:
+    """CallbackQuery mínima para exercitar os handlers sem o Telegram"""
+
+    def __init__(self, data: str, latency: float = 0.0):
+        self.data = data
+        self.latency = latency  # Ida e volta simulada da API do Telegram
+        self.last_text = None
+
+    async def answer(self, *args, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def edit_message_text(self, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.last_text = text
+
+
+class _FakeMessage:
+    def __init__(self, text: str, latency: float = 0.0):
+        self.text = text
+        self.latency = latency
+        self.last_text = None
+
+    async def reply_text(self, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.last_text = text
+
+
+class _FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class _FakeUpdate:
+    def __init__(self, query: Optional[_FakeQuery], user_id: int = 1,
+                 message: Optional[_FakeMessage] = None):
+        self.callback_query = query
+        self.message = message
+        self.effective_user = _FakeUser(user_id)
+        self.effective_chat = _FakeUser(user_id)
+
+
+class _FakeContext:
+    def __init__(self):
+        self.user_data = {}
+
+
+async def bench_get_odds(api: FakeOddsAPI, args) -> List[Dict]:
+    from odds_cache import OddsCache
+    from odds_client import OddsClient
+
+    sport = api.sports[0]['key']
+    client = OddsClient('bench', base_url=api.url, cache=OddsCache(ttl=0))
+    results = [
+        await measure("get_odds (rede, sem cache)", args.iterations,
+                      lambda: client.get_odds(sport))
+    ]
+
+    # Mesma consulta decodificando o corpo inteiro de uma vez
+    client.streaming = False
+    results.append(await measure("get_odds (rede, json completo)", args.iterations,
+                                 lambda: client.get_odds(sport)))
+    client.streaming = True
+
+    client.cache.ttl = 3600
+    await client.get_odds(sport)
+    results.append(await measure("get_odds (cache)", args.iterations,
+                                 lambda: client.get_odds(sport)))
+
+    sports = [s['key'] for s in api.sports[:args.sports]]
+    client.cache.ttl = 0
+    results.append(await measure(f"get_odds_many ({len(sports)} esportes)", args.iterations,
+                                 lambda: client.get_odds_many(sports)))
+    await client.close()
+    return results
+
+
+async def bench_calculate(args) -> List[Dict]:
+    from arbitrage_engine import IncrementalArbitrageEngine, get_engine
+
+    payload = generate_odds('bench_sport', games=args.games, bookmakers=args.bookmakers,
+                            outcomes=args.outcomes, arbitrage_density=args.density, seed=1,
+                            markets=args.markets.split(','))
+    results = []
+    for name in ('python', 'numpy'):
+        engine = get_engine(name)
+
+        async def run(engine=engine):
+            engine(payload, 1.0)
+
+        results.append(await measure(f"calculate_arbitrage ({name})", args.iterations, run))
+
+    incremental = IncrementalArbitrageEngine(get_engine('python'))
+    incremental.update('bench_sport', payload, 1.0)
+
+    async def run_incremental():
+        incremental.update('bench_sport', payload, 1.0)
+
+    results.append(await measure("calculate_arbitrage (incremental)", args.iterations,
+                                 run_incremental))
+    return results
+
+
+async def bench_search(api: FakeOddsAPI, args) -> List[Dict]:
+    os.environ['THE_ODDS_API_URL'] = api.url
+    os.environ.setdefault('THE_ODDS_API_KEY', 'bench')
+    os.environ.setdefault('ODDS_STORE_DIR', '')  # Sem gravar histórico durante o benchmark
+    from main import ArbitrageBot
+
+    bot = ArbitrageBot()
+    bot.outbox = _unlimited_outbox()
+    bot.scanner.sports = [s['key'] for s in api.sports[:args.sports]]
+    # Sem limite de créditos nem intervalo mínimo: cada varredura consulta todos os esportes
+    bot.scheduler.credits_per_hour = float('inf')
+    bot.scheduler.min_interval = 0
+    context = _FakeContext()
+
+    async def search():
+        await bot.search_arbitrage(_FakeUpdate(_FakeQuery('search_arb')), context)
+
+    # Varredura completa a cada clique (cache e resultado anteriores descartados)
+    interval = bot.scanner.interval
+    bot.scanner.interval = 0
+    results = [await measure("search_arbitrage (varredura)", args.iterations, search,
+                             setup=bot.odds_cache.clear)]
+
+    # Cliques servidos pela última varredura
+    bot.scanner.interval = interval
+    await search()
+    results.append(await measure("search_arbitrage (leitura)", args.iterations, search))
+
+    # Páginas seguintes montadas a partir do cache da versão
+    snapshot_id = bot.snapshots.latest.id
+
+    async def browse():
+        await bot.button_handler(_FakeUpdate(_FakeQuery(f'page:{snapshot_id}:1')), context)
+
+    results.append(await measure("search_arbitrage (página 2)", args.iterations, browse))
+
+    await bot.outbox.stop()
+    await bot.odds_client.close()
+    return results
+
+
+async def _replay_updates(bot, arrivals: List[Tuple[float, '_FakeUpdate']], contexts: Dict,
+                          processor=None) -> List[float]:
+    """Entrega os updates nos instantes sorteados, como o Application faria
+
+    Sem processor, um update por vez (o padrão do run_polling); com ele, cada update vira
+    uma task que passa pelo processor. Retorna a latência de cada update desde a chegada.
+    """
+    async def handle(update):
+        context = contexts[update.effective_user.id]
+        if update.callback_query is not None:
+            await bot.button_handler(update, context)
+        else:
+            await bot.handle_message(update, context)
+
+    latencies = []
+
+    async def process(update, arrived):
+        if processor is None:
+            await handle(update)
+        else:
+            await processor.process_update(update, handle(update))
+        latencies.append(time.perf_counter() - arrived)
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def generate():
+        started = time.perf_counter()
+        for at, update in arrivals:
+            await asyncio.sleep(max(0.0, started + at - time.perf_counter()))
+            queue.put_nowait((update, time.perf_counter()))
+        queue.put_nowait(None)
+
+    generator = asyncio.create_task(generate())
+    tasks = []
+    while (item := await queue.get()) is not None:
+        if processor is None:
+            await process(*item)
+        else:
+            tasks.append(asyncio.create_task(process(*item)))
+    await asyncio.gather(generator, *tasks)
+    return latencies
+
+
+async def bench_updates(api: FakeOddsAPI, args) -> List[Dict]:
+    """Carga simulada de usuários clicando ao mesmo tempo"""
+    import random
+
+    from update_processor import PerUserUpdateProcessor
+
+    os.environ['THE_ODDS_API_URL'] = api.url
+    os.environ.setdefault('THE_ODDS_API_KEY', 'bench')
+    os.environ.setdefault('ODDS_STORE_DIR', '')
+    from main import ArbitrageBot
+
+    bot = ArbitrageBot()
+    bot.outbox = _unlimited_outbox()  # Mede o processamento, não os limites do Telegram
+    bot.scanner.sports = [s['key'] for s in api.sports[:args.sports]]
+    bot.scheduler.credits_per_hour = float('inf')
+    bot.scheduler.min_interval = 0
+    await bot.scanner.get_latest()
+
+    def arrivals(seed: int) -> List[Tuple[float, _FakeUpdate]]:
+        # Cada usuário: busca, pede para calcular e digita um valor, em instantes de Poisson
+        rng = random.Random(seed)
+        latency = args.telegram_latency
+        result = []
+        for user_id in range(1, args.users + 1):
+            at = rng.expovariate(args.users / args.duration)
+            for step in ('search_arb', 'ask_amount', None):
+                update = (_FakeUpdate(_FakeQuery(step, latency), user_id) if step else
+                          _FakeUpdate(None, user_id, _FakeMessage('100', latency)))
+                result.append((at, update))
+                at += rng.expovariate(1 / args.think_time)
+        return sorted(result, key=lambda item: item[0])
+
+    results = []
+    for name, processor in (
+        ("updates (sequencial)", None),
+        ("updates (paralelo por usuário)", PerUserUpdateProcessor(
+            max_in_flight=int(os.getenv('MAX_CONCURRENT_UPDATES', '16')))),
+    ):
+        if processor is not None:
+            await processor.initialize()
+        contexts = {user_id: _FakeContext() for user_id in range(1, args.users + 1)}
+        updates = arrivals(seed=1)
+        tracemalloc.start()
+        latencies = await _replay_updates(bot, updates, contexts, processor)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Cada usuário terminou com o valor calculado e o estado limpo
+        answered = sum(
+            1 for _, update in updates
+            if update.message is not None and (update.message.last_text or '').startswith('💰 *CÁLCULO')
+        )
+        pending = sum(1 for context in contexts.values() if context.user_data.get('waiting_for_amount'))
+        results.append(report(name, latencies, peak))
+        if answered != args.users or pending:
+            print(f"  ! {answered}/{args.users} cálculos respondidos, {pending} usuários presos no valor")
+
+    await bot.outbox.stop()
+    await bot.odds_client.close()
+    return results
+
+
+async def bench_outbox(args) -> List[Dict]:
+    """Alertas em massa disputando os limites do Telegram com respostas interativas"""
+    import random
+
+    from telegram import Bot
+    from telegram.error import RetryAfter
+    from telegram.request import HTTPXRequest
+
+    from benchmarks.fake_telegram import FakeBotAPI
+    from outbox import ALERT, Outbox
+
+    results = []
+    for name in ('direto', 'outbox'):
+        api = FakeBotAPI(latency=args.telegram_latency).start()
+        # Mesmo pool de conexões que o Application configura para o bot
+        bot = Bot('1:bench', base_url=api.url, request=HTTPXRequest(connection_pool_size=256))
+        await bot.initialize()
+        outbox = Outbox() if name == 'outbox' else None
+        failures = []
+
+        async def call(chat_id, fn, method, priority, key=None):
+            if outbox is not None:
+                return await outbox.submit(chat_id, fn, method, priority, key)
+            try:
+                return await fn()
+            except RetryAfter as e:
+                failures.append(e)
+
+        async def alerts():
+            # Como o send_alerts antigo: um inscrito por vez (ou tudo na fila, com outbox)
+            started = time.perf_counter()
+            sends = []
+            for alert in range(args.alerts):
+                for chat_id in range(1, args.subscribers + 1):
+                    send = call(chat_id, lambda c=chat_id, a=alert: bot.send_message(c, f"alerta {a}"),
+                                'send_message', ALERT)
+                    if outbox is None:
+                        await send
+                    else:
+                        sends.append(send)
+            await asyncio.gather(*sends)
+            return time.perf_counter() - started
+
+        latencies = []
+
+        async def user(user_id: int, rng: random.Random):
+            await asyncio.sleep(rng.uniform(0, args.duration))
+            for step in range(3):
+                # Edição de progresso sem esperar, seguida do resultado na mesma mensagem
+                progress = asyncio.ensure_future(call(
+                    user_id, lambda: bot.edit_message_text('buscando...', user_id, 1),
+                    'edit_message_text', 0, key=('edit', 1)))
+                arrived = time.perf_counter()
+                await call(user_id, lambda s=step: bot.edit_message_text(f"resultado {s}", user_id, 1),
+                           'edit_message_text', 0, key=('edit', 1))
+                latencies.append(time.perf_counter() - arrived)
+                await progress
+                await asyncio.sleep(rng.expovariate(1 / args.think_time))
+
+        rng = random.Random(1)
+        alert_task = asyncio.create_task(alerts())
+        await asyncio.gather(*(user(user_id, rng) for user_id in range(1, args.users + 1)))
+        alerts_seconds = await alert_task
+
+        results.append(report(f"respostas com alertas ({name})", latencies, 0))
+        print(f"  alertas entregues em {alerts_seconds:.1f}s, {len(failures)} perdidos por 429, "
+              f"{api.rejected} respostas 429, {api.sent['editMessageText']} edições enviadas")
+        if outbox is not None:
+            await outbox.stop()
+        await bot.shutdown()
+        api.stop()
+    return results
+
+
+async def bench_alert_filters(args) -> List[Dict]:
+    """Busca dos inscritos de cada alerta no índice invertido contra a varredura linear"""
+    import random
+
+    from alert_filters import AlertFilter, AlertIndex
+    from arbitrage_engine import get_engine
+    from snapshots import Opportunity
+
+    rng = random.Random(1)
+    payload = generate_odds('bench_sport', games=args.games, bookmakers=args.bookmakers,
+                            arbitrage_density=1.0, seed=1)
+    opportunities = [Opportunity.from_dict(opp) for opp in get_engine('python')(payload, 0.0)][:20]
+    opportunities = [opp._replace(sport_key=rng.choice(('soccer_epl', 'basketball_nba', 'tennis_atp')))
+                     for opp in opportunities]
+    bookmakers = sorted({bet.bookmaker_key for opp in opportunities for bet in opp.bets})
+
+    index = AlertIndex()
+    for chat_id in range(args.filter_subscribers):
+        index.add(chat_id, AlertFilter(
+            min_margin=rng.choice((0.0, 1.0, 2.0, 3.0)),
+            sports=frozenset(rng.sample(('soccer', 'basketball_nba', 'tennis_atp'), rng.choice((0, 1)))),
+            bookmakers=frozenset(rng.sample(bookmakers, min(len(bookmakers), rng.choice((0, 3, 5))))),
+            min_stake=rng.choice((0.0, 0.0, 5.0, 20.0))
+        ))
+    filters = list(index.filters.items())
+    name = f"{len(opportunities)}x{args.filter_subscribers}"
+
+    async def indexed():
+        for opp in opportunities:
+            index.match(opp)
+
+    async def linear():
+        for opp in opportunities:
+            [chat_id for chat_id, alert_filter in filters if alert_filter.matches(opp)]
+
+    return [
+        await measure(f"filtros, índice ({name})", args.iterations, indexed),
+        await measure(f"filtros, linear ({name})", max(1, args.iterations // 10), linear),
+    ]
+
+
+async def bench_sharded(api: FakeOddsAPI, args) -> List[Dict]:
+    """Varredura em processos: esportes consultados por segundo e leitura das regiões"""
+    from main import ArbitrageBot
+
+    sports = [s['key'] for s in api.sports[:args.sports]]
+    # Sem orçamento, cache nem cálculo incremental: cada varredura consulta e recalcula tudo
+    overrides = {
+        'THE_ODDS_API_URL': api.url,
+        'THE_ODDS_API_KEY': os.getenv('THE_ODDS_API_KEY', 'bench'),
+        'ODDS_STORE_DIR': '',
+        'SCAN_SPORTS': ','.join(sports),
+        'SCAN_CREDITS_PER_HOUR': 'inf',
+        'ODDS_CACHE_TTL': '0',
+        'SCAN_INTERVAL': '0.001',
+        'INCREMENTAL_ARBITRAGE': '0',
+        'SCANNER_MODE': 'processes',
+        'SCANNER_POLL_INTERVAL': '0.05',
+        'SCANNER_WORKERS': '',
+    }
+    saved = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+
+    results = []
+    try:
+        for workers in args.shard_workers:
+            os.environ['SCANNER_WORKERS'] = str(workers)
+            bot = ArbitrageBot()
+            scanner = bot.scanner
+            scanner.worker_log_level = logging.WARNING
+            try:
+                await scanner.get_latest()  # Espera a primeira publicação de cada processo
+                polls = scanner.polls()
+                started = time.perf_counter()
+                await asyncio.sleep(args.shard_duration)
+                await scanner.scan_once()
+                rate = (scanner.polls() - polls) / (time.perf_counter() - started)
+                results.append(await measure(f"leitura dos shards ({workers} proc.)", args.iterations,
+                                             scanner.scan_once))
+                print(f"  {rate:.1f} esportes consultados/s, {len(scanner.store.latest)} oportunidades")
+            finally:
+                await scanner.stop()
+                await bot.odds_client.close()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return results
+
+
+def _unlimited_outbox():
+    from outbox import Outbox
+
+    return Outbox(global_rate=1e9, chat_rate=1e9, group_rate=1e9, chat_burst=1e9)
+
+
+async def main_async(args) -> List[Dict]:
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    api = FakeOddsAPI(
+        sports=generate_sports(max(args.sports, 1)),
+        latency=args.latency, jitter=args.jitter, quota=10 ** 9,
+        games=args.games, bookmakers=args.bookmakers, outcomes=args.outcomes,
+        markets=args.markets.split(','),
+        arbitrage_density=args.density
+    ).start()
+
+    print(f"{'benchmark':<34} {'runs':>5} {'p50 (ms)':>10} {'p99 (ms)':>10} {'pico (MB)':>10}")
+    try:
+        results = []
+        results += await bench_get_odds(api, args)
+        results += await bench_calculate(args)
+        if args.filter_subscribers:
+            results += await bench_alert_filters(args)
+        results += await bench_search(api, args)
+        if args.users:
+            results += await bench_updates(api, args)
+        if args.subscribers:
+            results += await bench_outbox(args)
+        if args.shard_workers:
+            results += await bench_sharded(api, args)
+        return results
+    finally:
+        api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks offline do bot de arbitragem")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--sports', type=int, default=4)
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--bookmakers', type=int, default=10)
+    parser.add_argument('--outcomes', type=int, default=2)
+    parser.add_argument('--markets', default='h2h', help="Mercados sintéticos (ex.: h2h,spreads,totals)")
+    parser.add_argument('--density', type=float, default=0.05, help="Fração de jogos com arbitragem")
+    parser.add_argument('--latency', type=float, default=0.02, help="Latência do servidor local (s)")
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--users', type=int, default=50, help="Usuários simulados (0 desativa)")
+    parser.add_argument('--duration', type=float, default=5.0, help="Janela de chegada dos usuários (s)")
+    parser.add_argument('--think-time', type=float, default=0.5, help="Pausa média entre cliques (s)")
+    parser.add_argument('--subscribers', type=int, default=100, help="Inscritos nos alertas (0 desativa)")
+    parser.add_argument('--filter-subscribers', type=int, default=100000,
+                        help="Inscritos com filtros no benchmark do índice de alertas (0 desativa)")
+    parser.add_argument('--alerts', type=int, default=2, help="Alertas enviados a cada inscrito")
+    parser.add_argument('--telegram-latency', type=float, default=0.05,
+                        help="Ida e volta simulada da API do Telegram (s)")
+    parser.add_argument('--shard-workers', default='1,2,4',
+                        help="Processos de varredura a comparar (vazio desativa)")
+    parser.add_argument('--shard-duration', type=float, default=5.0,
+                        help="Janela de medição de cada configuração de processos (s)")
+    args = parser.parse_args()
+    args.shard_workers = [int(workers) for workers in args.shard_workers.split(',') if workers]
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
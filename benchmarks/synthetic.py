@@ -0,0 +1,122 @@
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+BOOKMAKERS = [
+    ('bet365', 'Bet365'), ('williamhill', 'William Hill'), ('pinnacle', 'Pinnacle'),
+    ('betfair', 'Betfair'), ('draftkings', 'DraftKings'), ('fanduel', 'FanDuel'),
+    ('betmgm', 'BetMGM'), ('pointsbetus', 'PointsBet'), ('caesars', 'Caesars'),
+    ('unibet', 'Unibet'), ('betway', 'Betway'), ('sport888', 'SportingBet'), ('bwin', 'Bwin'),
+]
+
+SPORT_GROUPS = ['Soccer', 'Basketball', 'Tennis', 'American Football', 'Ice Hockey', 'Baseball']
+
+
+def _iso(moment: datetime) -> str:
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def generate_sports(count: int = 20) -> List[Dict]:
+    """Lista de esportes no formato de /sports"""
+    sports = []
+    for i in range(count):
+        group = SPORT_GROUPS[i % len(SPORT_GROUPS)]
+        key = f"{group.lower().replace(' ', '')}_league_{i}"
+        sports.append({
+            'key': key,
+            'group': group,
+            'title': f"{group} League {i}",
+            'description': f"Liga sintética {i}",
+            'active': True,
+            'has_outrights': False
+        })
+    return sports
+
+
+def generate_odds(
+    sport_key: str,
+    games: int = 50,
+    bookmakers: int = 8,
+    outcomes: int = 2,
+    arbitrage_density: float = 0.05,
+    seed: Optional[int] = None,
+    now: Optional[datetime] = None,
+    markets: Sequence[str] = ('h2h',),
+) -> List[Dict]:
+    """Jogos no formato de /sports/{key}/odds com uma fração de arbitragens garantidas
+
+    Além do h2h, markets pode incluir 'spreads' e 'totals' (linhas sorteadas entre poucas
+    opções para que várias casas cotem a mesma linha).
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    bookmakers = min(bookmakers, len(BOOKMAKERS))
+    payload = []
+
+    for i in range(games):
+        home, away = f"Time {i}A", f"Time {i}B"
+        names = [home, away]
+        if outcomes > 2:
+            names.append('Draw')
+        names += [f"Resultado {j}" for j in range(4, outcomes + 1)]
+
+        # Probabilidades "justas" do jogo
+        weights = [rng.uniform(0.5, 1.5) for _ in names]
+        total = sum(weights)
+        fair = [w / total for w in weights]
+
+        spread, spread_p = rng.choice((0.5, 1.5, 2.5)), rng.uniform(0.45, 0.55)
+        total, total_p = rng.choice((2.5, 3.5, 4.5)), rng.uniform(0.45, 0.55)
+
+        books = []
+        for key, title in rng.sample(BOOKMAKERS, bookmakers):
+            overround = rng.uniform(1.02, 1.08)
+            prices = [round(max(1.01, 1 / (p * overround) * rng.uniform(0.99, 1.01)), 2) for p in fair]
+            last_update = _iso(now - timedelta(seconds=rng.randint(0, 300)))
+            book_markets = [{
+                'key': 'h2h',
+                'last_update': last_update,
+                'outcomes': [{'name': n, 'price': price} for n, price in zip(names, prices)]
+            }]
+
+            def two_way(p: float, first: Dict, second: Dict) -> List[Dict]:
+                # Linhas de handicap/total costumam ter margem menor que o h2h
+                margin = rng.uniform(1.0, 1.04)
+                first['price'] = round(1 / (p * margin) * rng.uniform(0.985, 1.015), 2)
+                second['price'] = round(1 / ((1 - p) * margin) * rng.uniform(0.985, 1.015), 2)
+                return [first, second]
+
+            if 'spreads' in markets:
+                point = spread + rng.choice((0.0, 1.0))
+                book_markets.append({'key': 'spreads', 'last_update': last_update, 'outcomes': two_way(
+                    spread_p, {'name': home, 'point': -point}, {'name': away, 'point': point})})
+            if 'totals' in markets:
+                point = total + rng.choice((0.0, 1.0))
+                book_markets.append({'key': 'totals', 'last_update': last_update, 'outcomes': two_way(
+                    total_p, {'name': 'Over', 'point': point}, {'name': 'Under', 'point': point})})
+
+            books.append({
+                'key': key,
+                'title': title,
+                'last_update': last_update,
+                'markets': book_markets
+            })
+
+        if books and rng.random() < arbitrage_density:
+            # Cada resultado recebe, em uma casa qualquer, uma odd que fecha a arbitragem
+            margin = rng.uniform(0.01, 0.05)
+            for n, p in enumerate(fair):
+                outcome = rng.choice(books)['markets'][0]['outcomes'][n]
+                outcome['price'] = round(1 / (p / (1 + margin)), 2)
+
+        payload.append({
+            'id': f"{sport_key}_{i:05d}",
+            'sport_key': sport_key,
+            'sport_title': sport_key.replace('_', ' ').title(),
+            'commence_time': _iso(now + timedelta(hours=rng.randint(1, 72))),
+            'home_team': home,
+            'away_team': away,
+            'bookmakers': books
+        })
+
+    return payload
@@ -0,0 +1,123 @@
+import codecs
+import json
+import re
+import sys
+from typing import Any, AsyncIterator, Dict, List
+
+_SEPARATORS = re.compile(r'[\s,]*')
+
+# Campos lidos pelos motores; o resto (ex.: last_update do mercado, links) é descartado
+_EVENT_FIELDS = frozenset(('id', 'sport_key', 'sport_title', 'commence_time', 'home_team', 'away_team',
+                           'bookmakers'))
+_BOOKMAKER_FIELDS = frozenset(('key', 'title', 'last_update', 'markets'))
+_MARKET_FIELDS = frozenset(('key', 'outcomes'))
+_OUTCOME_FIELDS = frozenset(('name', 'price', 'point'))
+
+
+class ArrayDecoder:
+    """Decodifica os elementos de um array JSON de nível superior à medida que os bytes chegam
+
+    Cada elemento é decodificado pelo decoder em C assim que fica completo. Uma tentativa
+    sobre um elemento ainda cortado só se repete depois que o trecho pendente dobra de
+    tamanho, o que limita o retrabalho a uma fração constante do corpo.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._text = ''
+        self._min_pending = 0  # Tamanho pendente mínimo para tentar decodificar de novo
+        self.is_array = None  # None até o primeiro caractere significativo
+        self.finished = False
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[Any]:
+        """Acrescenta bytes e retorna os elementos que ficaram completos"""
+        self._text += self._utf8.decode(chunk, final)
+        text = self._text
+        position = _SEPARATORS.match(text).end() if self.is_array is None else 0
+
+        if self.is_array is None:
+            if position == len(text):
+                return []
+            self.is_array = text[position] == '['
+            if not self.is_array:
+                return []  # Objeto de erro: fica acumulado para remainder()
+            position += 1
+        elif not self.is_array or self.finished:
+            return []
+
+        elements = []
+        while True:
+            position = _SEPARATORS.match(text, position).end()
+            if position == len(text):
+                break
+            if text[position] == ']':
+                self.finished = True
+                position += 1
+                break
+
+            pending = len(text) - position
+            if pending < self._min_pending and not final:
+                break
+            try:
+                element, position = self._decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                self._min_pending = 2 * pending  # Elemento cortado: espera mais bytes
+                break
+            self._min_pending = 0
+            elements.append(element)
+
+        self._text = text[position:]
+        return elements
+
+    def remainder(self) -> str:
+        """Corpo acumulado quando a resposta não é um array (ex.: objeto de erro)"""
+        return self._text
+
+
+def _trim(item: Dict, fields: frozenset) -> None:
+    for field in [field for field in item if field not in fields]:
+        del item[field]
+
+
+def compact_event(game: Dict) -> Dict:
+    """Reduz o evento, no próprio dicionário, aos campos usados pelos motores
+
+    Strings repetidas entre eventos (casas, resultados) são internadas. Alterar no lugar
+    custa uma fração de reconstruir os dicionários.
+    """
+    intern = sys.intern
+    if not _EVENT_FIELDS.issuperset(game):
+        _trim(game, _EVENT_FIELDS)
+    for bookmaker in game.get('bookmakers', ()):
+        if not _BOOKMAKER_FIELDS.issuperset(bookmaker):
+            _trim(bookmaker, _BOOKMAKER_FIELDS)
+        bookmaker['title'] = intern(bookmaker['title'])
+        bookmaker['key'] = intern(bookmaker.get('key', ''))
+        for market in bookmaker.get('markets', ()):
+            if not _MARKET_FIELDS.issuperset(market):
+                _trim(market, _MARKET_FIELDS)
+            market['key'] = intern(market['key'])
+            for outcome in market['outcomes']:
+                if not _OUTCOME_FIELDS.issuperset(outcome):
+                    _trim(outcome, _OUTCOME_FIELDS)
+                outcome['name'] = intern(outcome['name'])
+    return game
+
+
+async def iter_events(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict]:
+    """Eventos compactos de uma resposta /odds, um a um, conforme o corpo chega"""
+    decoder = ArrayDecoder()
+    async for chunk in chunks:
+        for element in decoder.feed(chunk):
+            yield compact_event(element)
+    for element in decoder.feed(b'', final=True):
+        yield compact_event(element)
+
+    if not decoder.is_array:
+        body = decoder.remainder().strip()
+        raise ValueError(f"Resposta inesperada da API: {body[:200]}")
+    if not decoder.finished:
+        raise ValueError("Resposta da API truncada")
@@ -1,13 +1,30 @@
 import os
 import asyncio
 import logging
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+from telegram.helpers import escape_markdown
 import json
 
+from alert_filters import AlertFilter
+from arbitrage_engine import IncrementalArbitrageEngine, get_engine
+from metrics import ARBITRAGE_COMPUTE_SECONDS, RENDER_SECONDS, MetricsServer
+from odds_cache import CacheEntry, OddsCache
+from odds_client import OddsClient, parse_extra_markets
+from odds_store import OddsStore
+from outbox import ALERT, Outbox
+from scanner import ArbitrageScanner
+from scheduler import SportScheduler
+from sharded_scanner import ShardedScanner
+from singleflight import SingleFlight
+from snapshots import Opportunity, OpportunitySnapshot, RenderedOpportunity, SnapshotStore
+from update_processor import PerUserUpdateProcessor
+from verifier import OpportunityVerifier, Verification
+
 # Configurar logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -15,12 +32,138 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+SEPARATOR = "─" * 30 + "\n\n"
+
 class ArbitrageBot:
-    def __init__(self):
+    def __init__(self, shard: Optional[Tuple[int, int]] = None):
         self.telegram_token = os.getenv('TELEGRAM_BOT_TOKEN')
         self.odds_api_key = os.getenv('THE_ODDS_API_KEY')
-        self.odds_api_url = "https://api.the-odds-api.com/v4"
+        self.odds_api_url = os.getenv('THE_ODDS_API_URL', "https://api.the-odds-api.com/v4")
         self.min_profit_margin = 1.0  # 1% mínimo
+        self.arbitrage_engine = get_engine(os.getenv('ARBITRAGE_ENGINE', 'python'))  # python ou numpy
+        self.incremental_engine = None
+        if os.getenv('INCREMENTAL_ARBITRAGE', '1') == '1':
+            # Recalcula só os jogos com cotações novas (last_update) a cada varredura
+            self.incremental_engine = IncrementalArbitrageEngine(self.arbitrage_engine)
+        # Cotações mais antigas que isso (segundos) são ignoradas; 0 desativa
+        self.max_leg_age = float(os.getenv('MAX_LEG_AGE', '300')) or None
+        self.request_timeout = float(os.getenv('ODDS_REQUEST_TIMEOUT', '15'))  # Por requisição
+        self.scan_budget = float(os.getenv('ODDS_SCAN_BUDGET', '20'))  # Busca completa
+        self.cache_ttl = float(os.getenv('ODDS_CACHE_TTL', '60'))  # Segundos
+        self.odds_cache = OddsCache(
+            ttl=self.cache_ttl,
+            max_entries=int(os.getenv('ODDS_CACHE_SIZE', '128'))
+        )
+        self.odds_store = None
+        store_dir = os.getenv('ODDS_STORE_DIR', 'odds_history')  # Vazio desativa o histórico
+        if store_dir and shard is not None:
+            store_dir = os.path.join(store_dir, f'shard-{shard[0]}')  # Um escritor por diretório
+        if store_dir:
+            self.odds_store = OddsStore(
+                store_dir,
+                segment_bytes=int(float(os.getenv('ODDS_STORE_SEGMENT_MB', '64')) * 1024 * 1024),
+                max_bytes=int(float(os.getenv('ODDS_STORE_MAX_MB', '512')) * 1024 * 1024),
+                retention_days=float(os.getenv('ODDS_STORE_RETENTION_DAYS', '30'))
+            )
+        self.odds_client = OddsClient(
+            self.odds_api_key,
+            base_url=self.odds_api_url,
+            request_timeout=self.request_timeout,
+            cache=self.odds_cache,
+            store=self.odds_store,
+            # Ex.: basketball_nba=spreads,totals;americanfootball_nfl=spreads (ou *=totals)
+            extra_markets=parse_extra_markets(os.getenv('EXTRA_MARKETS', '')),
+            streaming=os.getenv('ODDS_STREAMING', '1') == '1'
+        )
+        self._event_executor = None
+        if self.incremental_engine is not None:
+            # Cada evento é calculado enquanto o resto da resposta ainda está chegando, numa
+            # thread própria: o cálculo e o lock do motor não travam o event loop
+            self._event_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='arbbot-events')
+            self.odds_client.on_event = self.evaluate_event
+        self.compute_flight = SingleFlight()
+        self._arbitrage_results: Dict[str, tuple] = {}  # sport -> (entrada do cache, oportunidades)
+        # Vazio = todos os esportes ativos retornados por /sports
+        self.scan_sports = [s for s in os.getenv('SCAN_SPORTS', '').split(',') if s]
+        self.scan_interval = float(os.getenv('SCAN_INTERVAL', '60'))  # 0 desativa a varredura automática
+        self.credits_per_hour = float(os.getenv('SCAN_CREDITS_PER_HOUR', '60'))  # Orçamento da API
+        # inline: varredura neste processo; processes: um processo por shard de esportes
+        self.scanner_mode = os.getenv('SCANNER_MODE', 'inline')
+        verify = os.getenv('VERIFY_OPPORTUNITIES', '1') == '1'
+        scheduler_credits = self.credits_per_hour
+        if self.scanner_mode == 'processes':
+            # O processo principal só reconfere e fica com a sua fração; o resto é dividido
+            # entre os processos de varredura, para o total não passar do orçamento
+            verify_share = float(os.getenv('VERIFY_CREDITS_SHARE', '0.2')) if verify else 0.0
+            if shard is None:
+                scheduler_credits *= verify_share
+            else:
+                scheduler_credits *= (1 - verify_share) / shard[1]
+        self.scheduler = SportScheduler(
+            credits_per_hour=scheduler_credits,
+            cost_per_poll=self.odds_client.poll_cost(''),
+            poll_cost=self.odds_client.poll_cost,
+            min_interval=self.cache_ttl
+        )
+        self.verifier = None
+        if verify:
+            # Reconfere as casas envolvidas pelo endpoint por evento antes de exibir ou alertar
+            self.verifier = OpportunityVerifier(
+                self.odds_client,
+                self.arbitrage_engine,
+                self.min_profit_margin,
+                max_leg_age=self.max_leg_age,
+                ttl=float(os.getenv('VERIFY_TTL', '15')),
+                budget=float(os.getenv('VERIFY_BUDGET', '5')),
+                scheduler=self.scheduler  # Consultas por evento descontadas do orçamento de créditos
+            )
+        self.snapshots = SnapshotStore()
+        self.page_size = int(os.getenv('RESULTS_PAGE_SIZE', '3'))  # Oportunidades por página
+        if self.scanner_mode == 'processes' and shard is None:
+            self.scanner = ShardedScanner(
+                self.odds_client,
+                self.find_opportunities,
+                self.scan_sports,
+                interval=float(os.getenv('SCANNER_POLL_INTERVAL', '1')),  # Leitura das regiões
+                store=self.snapshots,
+                scheduler=self.scheduler,
+                workers=int(os.getenv('SCANNER_WORKERS') or os.cpu_count() or 2),
+                region_bytes=int(float(os.getenv('SCANNER_REGION_MB', '16')) * 1024 * 1024)
+            )
+        else:
+            self.scanner = ArbitrageScanner(
+                self.odds_client,
+                self.find_opportunities,
+                self.scan_sports,
+                interval=self.scan_interval or self.cache_ttl,
+                budget=self.scan_budget,
+                store=self.snapshots,
+                scheduler=self.scheduler,
+                shard=shard
+            )
+        # Envios ao Telegram respeitam os limites global e por chat; respostas têm prioridade
+        self.outbox = Outbox(
+            global_rate=float(os.getenv('TELEGRAM_GLOBAL_RATE', '30')),
+            chat_rate=float(os.getenv('TELEGRAM_CHAT_RATE', '1')),
+            group_rate=float(os.getenv('TELEGRAM_GROUP_RATE_PER_MIN', '20')) / 60,
+            chat_burst=float(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+        )
+        # Updates de usuários diferentes rodam em paralelo; os de cada usuário, em ordem
+        self.update_processor = PerUserUpdateProcessor(
+            max_in_flight=int(os.getenv('MAX_CONCURRENT_UPDATES', '16')),
+            max_pending=int(os.getenv('MAX_PENDING_UPDATES', '256'))
+        )
+        # Com WEBHOOK_URL definido o bot recebe updates por webhook em vez de polling
+        self.webhook_url = os.getenv('WEBHOOK_URL', '')
+        self.webhook_listen = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+        self.webhook_port = int(os.getenv('WEBHOOK_PORT') or os.getenv('PORT') or '8443')
+        self.webhook_path = os.getenv('WEBHOOK_PATH', 'telegram')
+        self.webhook_secret = os.getenv('WEBHOOK_SECRET') or None
+        self.metrics_server = MetricsServer(
+            host=os.getenv('METRICS_HOST', '127.0.0.1'),
+            port=int(os.getenv('METRICS_PORT', '9108')),  # 0 desativa o endpoint
+            log_interval=float(os.getenv('METRICS_LOG_INTERVAL', '0'))  # Resumo no log (s)
+        )
         
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /start"""
@@ -45,135 +188,52 @@ Bem-vindo! Este bot encontra oportunidades de arbitragem com retorno garantido m
 Use os botões abaixo para começar!
         """
         
-        await update.message.reply_text(
+        await self.reply(update,
             welcome_msg, 
             parse_mode='Markdown',
             reply_markup=reply_markup
         )
 
-    def get_sports(self) -> List[Dict]:
+    async def get_sports(self) -> List[Dict]:
         """Busca esportes disponíveis na API"""
-        try:
-            url = f"{self.odds_api_url}/sports"
-            params = {
-                'apiKey': self.odds_api_key,
-                'all': 'false'  # Apenas esportes ativos
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            return response.json()
-            
-        except Exception as e:
-            logger.error(f"Erro ao buscar esportes: {e}")
-            return []
+        return await self.odds_client.get_sports()
 
-    def get_odds(self, sport_key: str) -> List[Dict]:
+    async def get_odds(self, sport_key: str) -> List[Dict]:
         """Busca odds para um esporte específico"""
+        return await self.odds_client.get_odds(sport_key)
+
+    def calculate_arbitrage(self, odds_data: List[Dict], sport_key: Optional[str] = None) -> List[Dict]:
+        """Calcula oportunidades de arbitragem"""
+        if sport_key and self.incremental_engine is not None:
+            return self.incremental_engine.update(sport_key, odds_data, self.min_profit_margin,
+                                                  self.max_leg_age)
+        return self.arbitrage_engine(odds_data, self.min_profit_margin, self.max_leg_age)
+
+    def evaluate_event(self, sport_key: str, game: Dict) -> None:
+        """Agenda o cálculo de um evento recebido em streaming antes do fim da resposta"""
+        self._event_executor.submit(self._evaluate_event, sport_key, game)
+
+    def _evaluate_event(self, sport_key: str, game: Dict) -> None:
         try:
-            url = f"{self.odds_api_url}/sports/{sport_key}/odds"
-            params = {
-                'apiKey': self.odds_api_key,
-                'regions': 'us,uk,eu',  # Múltiplas regiões para mais casas
-                'markets': 'h2h',  # Head to head (1x2 ou moneyline)
-                'oddsFormat': 'decimal',
-                'dateFormat': 'iso'
-            }
-            
-            response = requests.get(url, params=params, timeout=15)
-            response.raise_for_status()
-            
-            return response.json()
-            
+            self.incremental_engine.update_event(sport_key, game, self.min_profit_margin,
+                                                 self.max_leg_age)
         except Exception as e:
-            logger.error(f"Erro ao buscar odds para {sport_key}: {e}")
-            return []
+            logger.error(f"Erro ao processar evento de {sport_key}: {e}")
 
-    def calculate_arbitrage(self, odds_data: List[Dict]) -> List[Dict]:
-        """Calcula oportunidades de arbitragem"""
-        arbitrage_opportunities = []
-        
-        for game in odds_data:
-            try:
-                bookmakers = game.get('bookmakers', [])
-                if len(bookmakers) < 2:
-                    continue
-                
-                # Organizar odds por resultado
-                outcomes = {}
-                for bookmaker in bookmakers:
-                    bookie_name = bookmaker['title']
-                    markets = bookmaker.get('markets', [])
-                    
-                    for market in markets:
-                        if market['key'] != 'h2h':
-                            continue
-                            
-                        for outcome in market['outcomes']:
-                            outcome_name = outcome['name']
-                            price = float(outcome['price'])
-                            
-                            if outcome_name not in outcomes:
-                                outcomes[outcome_name] = []
-                            
-                            outcomes[outcome_name].append({
-                                'bookmaker': bookie_name,
-                                'odds': price
-                            })
-                
-                # Encontrar melhores odds para cada resultado
-                if len(outcomes) < 2:
-                    continue
-                
-                best_odds = {}
-                for outcome_name, odds_list in outcomes.items():
-                    best_odd = max(odds_list, key=lambda x: x['odds'])
-                    best_odds[outcome_name] = best_odd
-                
-                # Calcular se há arbitragem
-                implied_probabilities = []
-                total_investment = 100  # Base de R$ 100
-                
-                for outcome_name, best_odd in best_odds.items():
-                    implied_prob = 1 / best_odd['odds']
-                    implied_probabilities.append(implied_prob)
-                
-                total_implied_prob = sum(implied_probabilities)
-                
-                if total_implied_prob < 1.0:  # Há oportunidade de arbitragem
-                    profit_margin = ((1 / total_implied_prob) - 1) * 100
-                    
-                    if profit_margin >= self.min_profit_margin:
-                        # Calcular distribuição de apostas
-                        stakes = {}
-                        for outcome_name, best_odd in best_odds.items():
-                            stake_percentage = (1 / best_odd['odds']) / total_implied_prob
-                            stake_amount = total_investment * stake_percentage
-                            stakes[outcome_name] = {
-                                'bookmaker': best_odd['bookmaker'],
-                                'odds': best_odd['odds'],
-                                'stake': round(stake_amount, 2),
-                                'potential_return': round(stake_amount * best_odd['odds'], 2)
-                            }
-                        
-                        arbitrage_opportunities.append({
-                            'game': f"{game.get('home_team', 'Casa')} vs {game.get('away_team', 'Visitante')}",
-                            'sport': game.get('sport_title', 'Desconhecido'),
-                            'commence_time': game.get('commence_time', ''),
-                            'profit_margin': round(profit_margin, 2),
-                            'total_stake': total_investment,
-                            'guaranteed_profit': round(total_investment * (profit_margin / 100), 2),
-                            'bets': stakes
-                        })
-                        
-            except Exception as e:
-                logger.error(f"Erro ao calcular arbitragem: {e}")
-                continue
-        
-        # Ordenar por margem de lucro
-        arbitrage_opportunities.sort(key=lambda x: x['profit_margin'], reverse=True)
-        return arbitrage_opportunities
+    async def find_opportunities(self, sport_key: str, entry: CacheEntry) -> List[Dict]:
+        """Calcula as arbitragens de um esporte uma única vez por resposta da API"""
+        cached = self._arbitrage_results.get(sport_key)
+        if cached is not None and cached[0] is entry:
+            return cached[1]
+        
+        async def compute():
+            # Fora do event loop para não travar os outros usuários
+            with ARBITRAGE_COMPUTE_SECONDS.labels(sport_key).time():
+                opportunities = await asyncio.to_thread(self.calculate_arbitrage, entry.data, sport_key)
+            self._arbitrage_results[sport_key] = (entry, opportunities)
+            return opportunities
+        
+        return await self.compute_flight.do((sport_key, entry.fetched_at), compute)
 
     def get_bookmaker_link(self, bookmaker_name: str) -> str:
         """Retorna link das casas de apostas"""
@@ -219,7 +279,7 @@ O bot calculará automaticamente quanto apostar em cada casa para garantir o luc
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(
+        await self.edit(update,
             message,
             parse_mode='Markdown',
             reply_markup=reply_markup
@@ -228,34 +288,146 @@ O bot calculará automaticamente quanto apostar em cada casa para garantir o luc
         # Armazenar que está esperando valor
         context.user_data['waiting_for_amount'] = True
 
+    def render_opportunity(self, opp: Opportunity) -> RenderedOpportunity:
+        """Trechos fixos da mensagem de uma oportunidade (cacheados por versão)"""
+        links = [self.get_bookmaker_link(bet.bookmaker) for bet in opp.bets]
+        total_implied_prob = sum(1 / bet.odds for bet in opp.bets)
+        return RenderedOpportunity(
+            emoji="🔥" if opp.profit_margin >= 3 else "💰",
+            summary=(
+                f"⚽ {opp.game}\n"
+                f"🏆 {opp.sport}\n"
+                f"📋 {self.format_market(opp)}\n"
+                f"📈 Lucro: *{opp.profit_margin:.2f}%*\n"
+                f"💵 Lucro garantido: R$ {opp.guaranteed_profit:.2f}\n"
+                f"💼 Investimento base: R$ {opp.total_stake:.2f}\n\n"
+                "*📊 COMO APOSTAR:*\n"
+            ),
+            legs=tuple(
+                f"{j}. *{bet.outcome}*\n"
+                f"   💰 R$ {bet.stake:.2f}\n"
+                f"   🎯 Odd: {bet.odds:.2f}\n"
+                f"   🏠 [{bet.bookmaker}]({link})\n"
+                for j, (bet, link) in enumerate(zip(opp.bets, links), 1)
+            ),
+            custom_summary=(
+                f"⚽ {opp.game}\n"
+                f"📋 {self.format_market(opp)}\n"
+                f"📈 Lucro: *{opp.profit_margin:.2f}%*\n"
+            ),
+            leg_titles=tuple(f"{j}. *{bet.outcome}*\n" for j, bet in enumerate(opp.bets, 1)),
+            leg_odds=tuple(f"   🎯 Odd: {bet.odds:.2f}\n" for bet in opp.bets),
+            leg_bookmakers=tuple(
+                f"   🏠 [{bet.bookmaker}]({link})\n" for bet, link in zip(opp.bets, links)
+            ),
+            odds=tuple(bet.odds for bet in opp.bets),
+            fractions=tuple((1 / bet.odds) / total_implied_prob for bet in opp.bets),
+            last_updates=tuple(bet.last_update for bet in opp.bets)
+        )
+
+    def _rendered(self, opp: Opportunity, snapshot: Optional[OpportunitySnapshot]) -> RenderedOpportunity:
+        if snapshot is None:
+            return self.render_opportunity(opp)
+        return snapshot.render(opp, self.render_opportunity)
+
+    def _leg_ages(self, rendered: RenderedOpportunity) -> List[str]:
+        now = time.time()
+        return [
+            self.format_leg_age(max(0.0, now - last_update) if last_update else None)
+            for last_update in rendered.last_updates
+        ]
+
+    def format_opportunity(self, opp: Opportunity, title: str,
+                           verification: Optional[Verification] = None,
+                           snapshot: Optional[OpportunitySnapshot] = None) -> str:
+        """Monta o texto de uma oportunidade com o investimento base"""
+        rendered = self._rendered(opp, snapshot)
+        parts = [f"{rendered.emoji} *{title}*\n", rendered.summary]
+        for leg, age in zip(rendered.legs, self._leg_ages(rendered)):
+            parts += (leg, age)
+        parts += (self.format_verification(verification), SEPARATOR)
+        return ''.join(parts)
+
+    def format_custom_opportunity(self, opp: Opportunity, title: str, amount: float,
+                                  verification: Optional[Verification] = None,
+                                  snapshot: Optional[OpportunitySnapshot] = None) -> str:
+        """Monta o texto de uma oportunidade para o valor informado pelo usuário"""
+        rendered = self._rendered(opp, snapshot)
+        parts = [
+            f"{rendered.emoji} *{title}*\n",
+            rendered.custom_summary,
+            f"💵 Seu lucro: *R$ {amount * (opp.profit_margin / 100):.2f}*\n\n",
+            "*💳 SEUS VALORES PARA APOSTAR:*\n"
+        ]
+        legs = zip(rendered.leg_titles, rendered.leg_odds, rendered.leg_bookmakers,
+                   rendered.odds, rendered.fractions, self._leg_ages(rendered))
+        for leg_title, leg_odds, leg_bookmaker, odds, fraction, age in legs:
+            stake = amount * fraction
+            parts += (
+                leg_title,
+                f"   💰 Apostar: *R$ {stake:.2f}*\n",
+                leg_odds,
+                f"   💸 Retorno: R$ {stake * odds:.2f}\n",
+                leg_bookmaker,
+                age
+            )
+        parts += (self.format_verification(verification), SEPARATOR)
+        return ''.join(parts)
+
+    @staticmethod
+    def format_market(opp: Opportunity) -> str:
+        if opp.market == 'spreads':
+            return f"Handicap {opp.point:+g} (mandante)"
+        if opp.market == 'totals':
+            return f"Total {opp.point:g}"
+        return "Vencedor (1x2)"
+
+    @staticmethod
+    def format_leg_age(age: Optional[float]) -> str:
+        if age is None:
+            return "\n"
+        return f"   🕒 Cotação de {age:.0f}s atrás\n\n"
+
+    @staticmethod
+    def format_verification(verification: Optional[Verification]) -> str:
+        if verification is None:
+            return ""
+        if verification.status == 'unverified':
+            return "⚠️ Não foi possível reconferir agora\n\n"
+        if verification.latency is None:
+            return "✅ Reconferida\n\n"
+        return f"✅ Reconferida em {verification.latency * 1000:.0f}ms\n\n"
+
+    async def verified_top(self, snapshot: OpportunitySnapshot,
+                           limit: Optional[int] = None) -> Tuple[List[Tuple[Opportunity, Optional[Verification]]], int]:
+        """Top oportunidades reconferidas; retorna [(oportunidade, reconferência)] e quantas sumiram"""
+        candidates = snapshot.top(limit or self.page_size)
+        if self.verifier is None:
+            return [(opp, None) for opp in candidates], 0
+        
+        verifications = await self.verifier.verify_many(candidates)
+        shown = [(v.current, v) for v in verifications if v.current is not None]
+        return shown, len(verifications) - len(shown)
+
     async def search_arbitrage(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Busca oportunidades de arbitragem"""
         query = update.callback_query
         await query.answer()
         
-        await query.edit_message_text("🔍 Buscando oportunidades de arbitragem...")
+        # Sem await: se ainda estiver na fila quando o resultado ficar pronto, é substituída
+        self.edit(update, "🔍 Buscando oportunidades de arbitragem...")
         
-        # Buscar esportes principais
-        main_sports = ['soccer', 'basketball', 'tennis', 'americanfootball_nfl']
-        all_opportunities = []
+        # Resultado da última varredura (varre agora se estiver desatualizado)
+        snapshot = await self.scanner.get_latest()
         
-        for sport in main_sports:
-            try:
-                odds_data = self.get_odds(sport)
-                if odds_data:
-                    opportunities = self.calculate_arbitrage(odds_data)
-                    all_opportunities.extend(opportunities)
-            except Exception as e:
-                logger.error(f"Erro ao processar {sport}: {e}")
-        
-        if not all_opportunities:
+        if not snapshot.opportunities:
             keyboard = [
                 [InlineKeyboardButton("🔄 Tentar Novamente", callback_data='search_arb')],
                 [InlineKeyboardButton("🏠 Menu Principal", callback_data='main_menu')]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await query.edit_message_text(
+            await self.edit(update,
                 "❌ *Nenhuma oportunidade encontrada*\n\n"
                 "Não há arbitragens disponíveis no momento.\n"
                 "Tente novamente em alguns minutos.",
@@ -264,43 +436,86 @@ O bot calculará automaticamente quanto apostar em cada casa para garantir o luc
             )
             return
         
-        # Armazenar oportunidades no contexto
-        context.user_data['opportunities'] = all_opportunities
+        # Guardar só a versão do resultado; as oportunidades ficam no store compartilhado
+        context.user_data['snapshot_id'] = snapshot.id
+        context.user_data['page'] = 0
+        self.snapshots.acquire(update.effective_user.id, snapshot.id)
         
-        # Mostrar top 3 oportunidades de forma mais limpa
-        message = "🎯 *OPORTUNIDADES DE ARBITRAGEM*\n\n"
+        # Reconfere só as casas das melhores antes de mostrar
+        shown, gone = await self.verified_top(snapshot)
         
-        for i, opp in enumerate(all_opportunities[:3], 1):
-            profit_emoji = "🔥" if opp['profit_margin'] >= 3 else "💰"
-            
-            message += f"{profit_emoji} *OPORTUNIDADE {i}*\n"
-            message += f"⚽ {opp['game']}\n"
-            message += f"🏆 {opp['sport']}\n"
-            message += f"📈 Lucro: *{opp['profit_margin']:.2f}%*\n"
-            message += f"💵 Lucro garantido: R$ {opp['guaranteed_profit']:.2f}\n"
-            message += f"💼 Investimento base: R$ {opp['total_stake']:.2f}\n\n"
-            
-            message += "*📊 COMO APOSTAR:*\n"
-            for j, (outcome, bet_info) in enumerate(opp['bets'].items(), 1):
-                bookmaker_link = self.get_bookmaker_link(bet_info['bookmaker'])
-                message += f"{j}. *{outcome}*\n"
-                message += f"   💰 R$ {bet_info['stake']:.2f}\n"
-                message += f"   🎯 Odd: {bet_info['odds']:.2f}\n"
-                message += f"   🏠 [{bet_info['bookmaker']}]({bookmaker_link})\n\n"
-            
-            message += "─" * 30 + "\n\n"
+        render_started = time.perf_counter()
+        parts = ["🎯 *OPORTUNIDADES DE ARBITRAGEM*\n\n"]
+        for i, (opp, verification) in enumerate(shown, 1):
+            parts.append(self.format_opportunity(opp, f"OPORTUNIDADE {i}", verification, snapshot))
         
-        keyboard = [
+        if gone:
+            parts.append(f"❌ {gone} oportunidade(s) sumiram na reconferência\n")
+        parts.append(f"🕒 Odds atualizadas há {snapshot.data_age:.0f}s\n")
+        message = ''.join(parts)
+        RENDER_SECONDS.labels('search').observe(time.perf_counter() - render_started)
+        
+        await self.edit(update,
+            message,
+            parse_mode='Markdown',
+            reply_markup=self.results_keyboard(snapshot, 0),
+            disable_web_page_preview=True
+        )
+
+    def results_keyboard(self, snapshot: OpportunitySnapshot, page: int) -> InlineKeyboardMarkup:
+        """Botões da lista de oportunidades, com navegação entre páginas"""
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("⬅️ Anteriores", callback_data=f'page:{snapshot.id}:{page - 1}'))
+        if page + 1 < snapshot.pages(self.page_size):
+            navigation.append(InlineKeyboardButton("➡️ Mais oportunidades",
+                                                   callback_data=f'page:{snapshot.id}:{page + 1}'))
+        
+        keyboard = [navigation] if navigation else []
+        keyboard += [
             [InlineKeyboardButton("💰 Calcular para Meu Valor", callback_data='ask_amount')],
             [InlineKeyboardButton("🔄 Atualizar", callback_data='search_arb')],
             [InlineKeyboardButton("🏠 Menu Principal", callback_data='main_menu')]
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard)
+
+    async def show_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                        snapshot_id: int, page: int):
+        """Página da lista completa, montada a partir do cache da versão (sem recalcular)"""
+        query = update.callback_query
+        await query.answer()
+        
+        snapshot = self.snapshots.get(snapshot_id)
+        if snapshot is None:
+            keyboard = [[InlineKeyboardButton("🔄 Buscar Novamente", callback_data='search_arb')]]
+            await self.edit(update,
+                "⌛ Essa lista expirou. Busque novamente para ver as oportunidades atuais.",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+            return
+        
+        page = min(max(page, 0), snapshot.pages(self.page_size) - 1)
+        context.user_data['snapshot_id'] = snapshot.id
+        context.user_data['page'] = page
+        self.snapshots.acquire(update.effective_user.id, snapshot.id)
+        
+        render_started = time.perf_counter()
+        first = page * self.page_size + 1
+        opportunities = snapshot.page(page, self.page_size)
+        parts = [
+            f"📚 *OPORTUNIDADES {first}-{first + len(opportunities) - 1} DE {len(snapshot)}* "
+            f"(página {page + 1}/{snapshot.pages(self.page_size)})\n\n"
+        ]
+        for i, opp in enumerate(opportunities, first):
+            parts.append(self.format_opportunity(opp, f"OPORTUNIDADE {i}", snapshot=snapshot))
+        parts.append(f"🕒 Odds de {snapshot.data_age:.0f}s atrás, sem reconferência: confira antes de apostar\n")
+        message = ''.join(parts)
+        RENDER_SECONDS.labels('page').observe(time.perf_counter() - render_started)
         
-        await query.edit_message_text(
+        await self.edit(update,
             message,
             parse_mode='Markdown',
-            reply_markup=reply_markup,
+            reply_markup=self.results_keyboard(snapshot, page),
             disable_web_page_preview=True
         )
 
@@ -309,10 +524,10 @@ O bot calculará automaticamente quanto apostar em cada casa para garantir o luc
         query = update.callback_query
         await query.answer()
         
-        sports = self.get_sports()
+        sports = await self.get_sports()
         
         if not sports:
-            await query.edit_message_text("❌ Erro ao carregar esportes disponíveis.")
+            await self.edit(update, "❌ Erro ao carregar esportes disponíveis.")
             return
         
         message = "📊 *Esportes Disponíveis para Arbitragem*\n\n"
@@ -326,7 +541,7 @@ O bot calculará automaticamente quanto apostar em cada casa para garantir o luc
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(
+        await self.edit(update,
             message,
             parse_mode='Markdown',
             reply_markup=reply_markup
@@ -341,10 +556,14 @@ O bot calculará automaticamente quanto apostar em cada casa para garantir o luc
 ⚙️ *Configurações do Bot*
 
 • Margem mínima de lucro: {self.min_profit_margin}%
+• Idade máxima das cotações: {f'{self.max_leg_age:.0f}s' if self.max_leg_age else 'sem limite'}
+• Reconferência antes de exibir: {'ativa' if self.verifier is not None else 'desativada'}
 • Regiões das casas: US, UK, EU
-• Mercados: Head-to-Head (1x2)
+• Mercados: {self._markets_description()}
 • Formato das odds: Decimal
-• Atualização: Manual
+• Atualização: {self._update_mode()} (cache de {self.cache_ttl:.0f}s)
+• Esportes: {self.scanner.sports_count() or 'todos'} ativos, {self.credits_per_hour:.0f} créditos/h
+• Alertas: /alertas para ativar, /filtro para ajustar, /parar para desativar
 
 *Status da API:* ✅ Conectada
         """
@@ -355,17 +574,171 @@ O bot calculará automaticamente quanto apostar em cada casa para garantir o luc
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(
+        await self.edit(update,
             message,
             parse_mode='Markdown',
             reply_markup=reply_markup
         )
 
+    def _markets_description(self) -> str:
+        extra = self.odds_client.extra_markets
+        if not extra:
+            return "Head-to-Head (1x2)"
+        # Chaves como basketball_nba ou h2h_lay quebrariam o Markdown (_ abre itálico)
+        details = escape_markdown(', '.join(f"{sport}: {'+'.join(markets)}" for sport, markets in extra.items()))
+        return f"Head-to-Head (1x2), extras por esporte ({details})"
+
+    def _update_mode(self) -> str:
+        if self.scan_interval > 0:
+            return f"Automática a cada {self.scan_interval:.0f}s"
+        return "Manual"
+
+    async def subscribe_alerts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /alertas"""
+        if self.scan_interval <= 0:
+            await self.reply(update, "❌ Varredura automática desativada neste servidor.")
+            return
+        
+        alert_filter = context.user_data.get('alert_filter', AlertFilter())
+        if self.scanner.subscribe(update.effective_chat.id, alert_filter):
+            message = (
+                "🔔 *Alertas ativados!*\n\n"
+                f"Você receberá novas arbitragens com lucro a partir de "
+                f"{max(self.min_profit_margin, alert_filter.min_margin)}%.\n"
+                f"{self.format_alert_filter(alert_filter)}\n"
+                "Use /filtro para ajustar e /parar para desativar."
+            )
+        else:
+            message = "🔔 Seus alertas já estão ativos. Use /parar para desativar."
+        
+        await self.reply(update, message, parse_mode='Markdown')
+
+    async def unsubscribe_alerts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /parar"""
+        if self.scanner.unsubscribe(update.effective_chat.id):
+            await self.reply(update, "🔕 Alertas desativados.")
+        else:
+            await self.reply(update, "🔕 Seus alertas já estavam desativados.")
+
+    async def set_alert_filter(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /filtro: margem, esportes, casas e aposta mínima dos alertas"""
+        alert_filter = context.user_data.get('alert_filter', AlertFilter())
+        args = context.args or []
+        
+        if args:
+            field, values = args[0].lower(), ' '.join(args[1:])
+            items = frozenset(item.strip().lower() for item in values.split(',') if item.strip())
+            try:
+                if field == 'limpar':
+                    alert_filter = AlertFilter()
+                elif field == 'margem':
+                    alert_filter = alert_filter._replace(min_margin=float(values.replace(',', '.')))
+                elif field == 'aposta':
+                    alert_filter = alert_filter._replace(min_stake=float(values.replace(',', '.')))
+                elif field == 'esportes':
+                    alert_filter = alert_filter._replace(sports=items)
+                elif field == 'casas':
+                    alert_filter = alert_filter._replace(bookmakers=items)
+                else:
+                    raise ValueError(field)
+            except ValueError:
+                await self.reply(update,
+                    "❌ Uso: /filtro margem 2 | aposta 10 | esportes soccer,basketball_nba | "
+                    "casas bet365,pinnacle | limpar\n"
+                    "(esportes e casas vazios aceitam todos)"
+                )
+                return
+            
+            context.user_data['alert_filter'] = alert_filter
+            self.scanner.set_filter(update.effective_chat.id, alert_filter)
+        
+        subscribed = update.effective_chat.id in self.scanner.subscribers
+        await self.reply(update,
+            "🎛️ *Filtro dos alertas*\n\n"
+            f"{self.format_alert_filter(alert_filter)}\n\n"
+            + ("🔔 Alertas ativos." if subscribed else "🔕 Alertas desativados: use /alertas para ativar."),
+            parse_mode='Markdown'
+        )
+
+    def format_alert_filter(self, alert_filter: AlertFilter) -> str:
+        margin = max(self.min_profit_margin, alert_filter.min_margin)
+        # Chaves como basketball_nba quebrariam o Markdown (_ abre itálico)
+        sports = escape_markdown(', '.join(sorted(alert_filter.sports)))
+        bookmakers = escape_markdown(', '.join(sorted(alert_filter.bookmakers)))
+        return (
+            f"• Margem mínima: {margin:g}%\n"
+            f"• Esportes: {sports or 'todos'}\n"
+            f"• Casas: {bookmakers or 'todas'}\n"
+            f"• Menor aposta (investimento base): "
+            f"{f'R$ {alert_filter.min_stake:.2f}' if alert_filter.min_stake else 'qualquer'}"
+        )
+
+    async def send_alerts(self, bot, opportunities: List[Opportunity]):
+        """Envia todas as novas oportunidades para os inscritos"""
+        # Todas as novas, não só uma página: já foram marcadas como alertadas pelo scanner.
+        # Os filtros vêm antes da reconferência: só quem tem algum inscrito interessado é conferida
+        wanted = tuple(opp for opp in opportunities if self.scanner.subscribers.match(opp))
+        if not wanted:
+            return
+        shown, _ = await self.verified_top(OpportunitySnapshot(0, wanted), limit=len(wanted))
+        recipients = []
+        sends = []
+        for opp, verification in shown:
+            message = "🚨 *NOVA ARBITRAGEM*\n\n" + self.format_opportunity(opp, "OPORTUNIDADE", verification)
+            
+            # Só os inscritos cujo filtro aceita a oportunidade com os valores reconferidos
+            for chat_id in self.scanner.subscribers.match(opp):
+                recipients.append(chat_id)
+                # O outbox aplica os limites do Telegram; tudo entra na fila de uma vez
+                sends.append(self.outbox.submit(
+                    chat_id,
+                    lambda chat_id=chat_id, message=message: bot.send_message(
+                        chat_id,
+                        message,
+                        parse_mode='Markdown',
+                        disable_web_page_preview=True
+                    ),
+                    'send_message',
+                    priority=ALERT
+                ))
+        results = await asyncio.gather(*sends, return_exceptions=True)
+        for chat_id, result in zip(recipients, results):
+            if isinstance(result, Exception):
+                logger.error(f"Erro ao enviar alerta para {chat_id}: {result}")
+
+    def edit(self, update: Update, text: str, **kwargs) -> asyncio.Future:
+        """Edita a mensagem do botão pela fila de envio
+
+        Uma edição ainda não enviada da mesma mensagem é substituída por esta.
+        """
+        query = update.callback_query
+        message = getattr(query, 'message', None)
+        key = ('edit', message.message_id) if message is not None else None
+        return self.outbox.submit(
+            update.effective_chat.id,
+            lambda: query.edit_message_text(text, **kwargs),
+            'edit_message_text',
+            key=key
+        )
+
+    def reply(self, update: Update, text: str, **kwargs) -> asyncio.Future:
+        """Responde à mensagem do usuário pela fila de envio"""
+        return self.outbox.submit(
+            update.effective_chat.id,
+            lambda: update.message.reply_text(text, **kwargs),
+            'reply_text'
+        )
+
     async def main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Volta ao menu principal"""
         query = update.callback_query
         await query.answer()
         
+        # Fim da visualização dos resultados: a versão deixa de ser referenciada pelo usuário
+        self.snapshots.release(update.effective_user.id)
+        context.user_data.pop('snapshot_id', None)
+        context.user_data.pop('page', None)
+        
         keyboard = [
             [InlineKeyboardButton("🔍 Buscar Arbitragens", callback_data='search_arb')],
             [InlineKeyboardButton("⚙️ Configurações", callback_data='settings')],
@@ -386,7 +759,7 @@ Bot ativo e pronto para encontrar oportunidades!
 Use os botões abaixo:
         """
         
-        await query.edit_message_text(
+        await self.edit(update,
             welcome_msg,
             parse_mode='Markdown',
             reply_markup=reply_markup
@@ -398,44 +771,35 @@ Use os botões abaixo:
             custom_amount = float(update.message.text.strip())
             
             if custom_amount <= 0:
-                await update.message.reply_text("❌ Por favor, digite um valor maior que zero.")
+                await self.reply(update, "❌ Por favor, digite um valor maior que zero.")
                 return
             
-            opportunities = context.user_data.get('opportunities', [])
-            if not opportunities:
-                await update.message.reply_text("❌ Nenhuma oportunidade disponível. Busque novamente.")
+            snapshot = self.snapshots.get(context.user_data.get('snapshot_id'))
+            if snapshot is None or not snapshot.opportunities:
+                await self.reply(update, "❌ Nenhuma oportunidade disponível. Busque novamente.")
                 return
             
-            # Recalcular com o valor personalizado
-            message = f"💰 *CÁLCULO PERSONALIZADO - R$ {custom_amount:.2f}*\n\n"
+            # Mesmas oportunidades que o usuário está vendo (a 1ª página vem reconferida)
+            page = context.user_data.get('page', 0)
+            if page == 0:
+                shown, gone = await self.verified_top(snapshot)
+            else:
+                shown, gone = [(opp, None) for opp in snapshot.page(page, self.page_size)], 0
+            
+            # Valores a partir das frações de cada aposta, já calculadas para a versão
+            render_started = time.perf_counter()
+            first = page * self.page_size + 1
+            parts = [f"💰 *CÁLCULO PERSONALIZADO - R$ {custom_amount:.2f}*\n\n"]
+            for i, (opp, verification) in enumerate(shown, first):
+                parts.append(self.format_custom_opportunity(
+                    opp, f"OPORTUNIDADE {i}", custom_amount, verification, snapshot
+                ))
+            
+            if gone:
+                parts.append(f"❌ {gone} oportunidade(s) sumiram na reconferência\n")
+            message = ''.join(parts)
             
-            for i, opp in enumerate(opportunities[:3], 1):
-                profit_emoji = "🔥" if opp['profit_margin'] >= 3 else "💰"
-                
-                # Recalcular stakes com o novo valor
-                total_implied_prob = sum([1/bet_info['odds'] for bet_info in opp['bets'].values()])
-                custom_profit = custom_amount * (opp['profit_margin'] / 100)
-                
-                message += f"{profit_emoji} *OPORTUNIDADE {i}*\n"
-                message += f"⚽ {opp['game']}\n"
-                message += f"📈 Lucro: *{opp['profit_margin']:.2f}%*\n"
-                message += f"💵 Seu lucro: *R$ {custom_profit:.2f}*\n\n"
-                
-                message += "*💳 SEUS VALORES PARA APOSTAR:*\n"
-                
-                for j, (outcome, bet_info) in enumerate(opp['bets'].items(), 1):
-                    stake_percentage = (1 / bet_info['odds']) / total_implied_prob
-                    custom_stake = custom_amount * stake_percentage
-                    custom_return = custom_stake * bet_info['odds']
-                    bookmaker_link = self.get_bookmaker_link(bet_info['bookmaker'])
-                    
-                    message += f"{j}. *{outcome}*\n"
-                    message += f"   💰 Apostar: *R$ {custom_stake:.2f}*\n"
-                    message += f"   🎯 Odd: {bet_info['odds']:.2f}\n"
-                    message += f"   💸 Retorno: R$ {custom_return:.2f}\n"
-                    message += f"   🏠 [{bet_info['bookmaker']}]({bookmaker_link})\n\n"
-                
-                message += "─" * 30 + "\n\n"
+            RENDER_SECONDS.labels('custom_amount').observe(time.perf_counter() - render_started)
             
             keyboard = [
                 [InlineKeyboardButton("💰 Calcular Outro Valor", callback_data='ask_amount')],
@@ -444,7 +808,7 @@ Use os botões abaixo:
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await update.message.reply_text(
+            await self.reply(update,
                 message,
                 parse_mode='Markdown',
                 reply_markup=reply_markup,
@@ -455,20 +819,20 @@ Use os botões abaixo:
             context.user_data['waiting_for_amount'] = False
             
         except ValueError:
-            await update.message.reply_text(
+            await self.reply(update,
                 "❌ Por favor, digite apenas números.\n"
                 "Exemplo: 100 (para R$ 100)"
             )
         except Exception as e:
             logger.error(f"Erro ao calcular valor personalizado: {e}")
-            await update.message.reply_text("❌ Erro no cálculo. Tente novamente.")
+            await self.reply(update, "❌ Erro no cálculo. Tente novamente.")
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler para mensagens de texto"""
         if context.user_data.get('waiting_for_amount'):
             await self.calculate_custom_amount(update, context)
         else:
-            await update.message.reply_text(
+            await self.reply(update,
                 "👋 Use o comando /start para acessar o menu principal!"
             )
 
@@ -487,6 +851,31 @@ Use os botões abaixo:
         handler = handlers.get(query.data)
         if handler:
             await handler(update, context)
+        elif query.data.startswith('page:'):
+            # page:<id da versão>:<página>
+            try:
+                _, snapshot_id, page = query.data.split(':')
+                await self.show_page(update, context, int(snapshot_id), int(page))
+            except ValueError:
+                await query.answer()
+
+    async def post_init(self, application: Application):
+        """Inicia a varredura automática e as métricas junto com o bot"""
+        await self.metrics_server.start()
+        self.outbox.start()
+        if self.scan_interval > 0:
+            self.scanner.on_alert = lambda opportunities: self.send_alerts(application.bot, opportunities)
+        if self.scan_interval > 0 or isinstance(self.scanner, ShardedScanner):
+            self.scanner.start()
+
+    async def post_shutdown(self, application: Application):
+        """Libera recursos ao encerrar o bot"""
+        await self.scanner.stop()
+        await self.outbox.stop()
+        await self.metrics_server.stop()
+        await self.odds_client.close()
+        if self._event_executor is not None:
+            self._event_executor.shutdown(wait=False, cancel_futures=True)
 
     def run(self):
         """Inicia o bot"""
@@ -499,16 +888,37 @@ Use os botões abaixo:
             return
         
         # Criar aplicação
-        application = Application.builder().token(self.telegram_token).build()
+        application = (
+            Application.builder()
+            .token(self.telegram_token)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .concurrent_updates(self.update_processor)
+            .build()
+        )
         
         # Registrar handlers
         application.add_handler(CommandHandler("start", self.start))
+        application.add_handler(CommandHandler("alertas", self.subscribe_alerts))
+        application.add_handler(CommandHandler("parar", self.unsubscribe_alerts))
+        application.add_handler(CommandHandler("filtro", self.set_alert_filter))
         application.add_handler(CallbackQueryHandler(self.button_handler))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         
         # Iniciar bot
-        logger.info("Bot iniciado!")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if self.webhook_url:
+            logger.info(f"Bot iniciado (webhook em {self.webhook_listen}:{self.webhook_port}/{self.webhook_path})!")
+            application.run_webhook(
+                listen=self.webhook_listen,
+                port=self.webhook_port,
+                url_path=self.webhook_path,
+                webhook_url=f"{self.webhook_url.rstrip('/')}/{self.webhook_path}",
+                secret_token=self.webhook_secret,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            logger.info("Bot iniciado!")
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     bot = ArbitrageBot()
@@ -0,0 +1,378 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], '_Metric'] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> '_Metric':
+        """Série filha com os valores de rótulo informados"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> '_Metric':
+        return type(self)(self.name, self.documentation)
+
+    def _series(self) -> Iterator[Tuple[Tuple[str, ...], '_Metric']]:
+        if self.labelnames:
+            yield from list(self._children.items())
+        else:
+            yield (), self
+
+    def state(self) -> Dict[Tuple[str, ...], object]:
+        """Valores de cada série em tipos simples (serializáveis com marshal)"""
+        series = {values: child._state() for values, child in self._series()}
+        return {values: value for values, value in series.items() if value is not None}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._series():
+            lines.extend(child._samples(self.name, self.labelnames, values))
+        return lines
+
+
+class Counter(_Metric):
+    """Contador monotônico"""
+
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _state(self) -> float:
+        return self.value
+
+    def _samples(self, name, labelnames, values) -> List[str]:
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+
+class Gauge(_Metric):
+    """Valor instantâneo"""
+
+    kind = 'gauge'
+
+    def __init__(self, *args, merge: Callable[[Iterable[float]], float] = sum, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.merge = merge  # Junta os valores de vários processos (ver RemoteMetrics)
+        self.value = 0.0
+        self.updated = False
+
+    def _new_child(self) -> 'Gauge':
+        return Gauge(self.name, self.documentation, merge=self.merge)
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+        self.updated = True
+
+    def _state(self) -> Optional[float]:
+        return self.value if self.updated else None  # Nunca definido: nada a informar
+
+    def _samples(self, name, labelnames, values) -> List[str]:
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+
+class Histogram(_Metric):
+    """Histograma de latências com buckets cumulativos"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def _new_child(self) -> 'Histogram':
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Mede a duração do bloco"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def _state(self) -> Tuple[Tuple[int, ...], int, float]:
+        return tuple(self.counts), self.count, self.sum
+
+    def merged(self) -> Tuple[int, float]:
+        """(contagem, soma) de todas as séries"""
+        series = [child for _, child in self._series()]
+        return sum(child.count for child in series), sum(child.sum for child in series)
+
+    def _samples(self, name, labelnames, values) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {self.count}")
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas exposto no formato texto do Prometheus"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def state(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        """Estado de todas as métricas, para publicar a outro processo"""
+        return {metric.name: metric.state() for metric in self._metrics}
+
+    def get(self, name: str) -> Optional[_Metric]:
+        for metric in self._metrics:
+            if metric.name == name:
+                return metric
+        return None
+
+
+class RemoteMetrics:
+    """Incorpora nas métricas locais as publicadas por outros processos
+
+    Cada fonte publica seus valores acumulados; contadores e histogramas recebem só o
+    que cresceu desde a última publicação (um valor menor indica que a fonte reiniciou)
+    e gauges recebem o `merge` dos últimos valores de todas as fontes.
+    """
+
+    def __init__(self, registry: Optional[Registry] = None):
+        self.registry = registry if registry is not None else REGISTRY
+        self._last: Dict[Hashable, Dict[str, Dict[Tuple[str, ...], object]]] = {}
+
+    def apply(self, source: Hashable, state: Dict[str, Dict[Tuple[str, ...], object]]) -> None:
+        previous = self._last.get(source, {})
+        self._last[source] = state
+        for name, series in state.items():
+            metric = self.registry.get(name)
+            if metric is None or isinstance(metric, Gauge):
+                continue
+            before = previous.get(name, {})
+            for values, current in series.items():
+                child = metric.labels(*values) if metric.labelnames else metric
+                if isinstance(metric, Counter):
+                    old = before.get(values, 0.0)
+                    child.inc(current - old if current >= old else current)
+                else:
+                    counts, count, total = current
+                    old_counts, old_count, old_total = before.get(values, ((0,) * len(counts), 0, 0.0))
+                    if count < old_count or len(old_counts) != len(counts):
+                        old_counts, old_count, old_total = (0,) * len(counts), 0, 0.0
+                    with child._lock:
+                        for i, (new, old) in enumerate(zip(counts, old_counts)):
+                            child.counts[i] += new - old
+                        child.count += count - old_count
+                        child.sum += total - old_total
+        self._merge_gauges()
+
+    def forget(self, source: Hashable) -> None:
+        """Descarta os gauges de uma fonte que deixou de existir"""
+        if self._last.pop(source, None) is not None:
+            self._merge_gauges()
+
+    def _merge_gauges(self) -> None:
+        gauges: Dict[Tuple[str, Tuple[str, ...]], List[float]] = {}
+        for state in self._last.values():
+            for name, series in state.items():
+                for values, value in series.items():
+                    gauges.setdefault((name, values), []).append(value)
+        for (name, values), found in gauges.items():
+            metric = self.registry.get(name)
+            if isinstance(metric, Gauge):
+                child = metric.labels(*values) if metric.labelnames else metric
+                child.set(metric.merge(found))
+
+
+REGISTRY = Registry()
+
+ODDS_FETCH_SECONDS = REGISTRY.register(Histogram(
+    'arbbot_odds_fetch_seconds', 'Latência das chamadas de odds à API', ['sport']))
+ODDS_FIRST_EVENT_SECONDS = REGISTRY.register(Histogram(
+    'arbbot_odds_first_event_seconds', 'Tempo até o primeiro evento completo de uma resposta de odds',
+    ['sport']))
+ODDS_FETCH_ERRORS = REGISTRY.register(Counter(
+    'arbbot_odds_fetch_errors_total', 'Falhas ao buscar odds', ['sport']))
+ODDS_CACHE_REQUESTS = REGISTRY.register(Counter(
+    'arbbot_odds_cache_requests_total', 'Consultas ao cache de odds', ['result']))
+API_QUOTA_REMAINING = REGISTRY.register(Gauge(
+    'arbbot_api_quota_remaining', 'Créditos restantes na The Odds API', merge=min))
+API_QUOTA_USED = REGISTRY.register(Gauge(
+    'arbbot_api_quota_used', 'Créditos usados na The Odds API', merge=max))
+ARBITRAGE_COMPUTE_SECONDS = REGISTRY.register(Histogram(
+    'arbbot_arbitrage_compute_seconds', 'Duração do calculate_arbitrage', ['sport']))
+SCAN_SECONDS = REGISTRY.register(Histogram(
+    'arbbot_scan_seconds', 'Duração de uma varredura completa'))
+SWEEP_SECONDS = REGISTRY.register(Gauge(
+    'arbbot_sweep_seconds', 'Tempo de relógio da última varredura completa de todos os esportes',
+    merge=max))
+SPORTS_ACTIVE = REGISTRY.register(Gauge(
+    'arbbot_sports_active', 'Esportes ativos agendados para varredura'))
+OPPORTUNITIES_FOUND = REGISTRY.register(Counter(
+    'arbbot_opportunities_found_total', 'Oportunidades encontradas nas varreduras'))
+OPPORTUNITIES_CURRENT = REGISTRY.register(Gauge(
+    'arbbot_opportunities_current', 'Oportunidades na última varredura'))
+VERIFY_SECONDS = REGISTRY.register(Histogram(
+    'arbbot_verify_seconds', 'Latência da reconferência por evento antes de exibir'))
+VERIFY_RESULTS = REGISTRY.register(Counter(
+    'arbbot_verify_results_total', 'Resultados das reconferências', ['result']))
+RENDER_SECONDS = REGISTRY.register(Histogram(
+    'arbbot_render_seconds', 'Montagem das mensagens', ['view'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)))
+SHARD_AGE_SECONDS = REGISTRY.register(Gauge(
+    'arbbot_shard_age_seconds', 'Tempo desde a última publicação de cada processo de varredura', ['shard']))
+SCANNER_WORKER_RESTARTS = REGISTRY.register(Counter(
+    'arbbot_scanner_worker_restarts_total', 'Processos de varredura reiniciados após terminarem'))
+UPDATE_SECONDS = REGISTRY.register(Histogram(
+    'arbbot_update_seconds', 'Processamento de um update do Telegram, incluindo a espera na fila'))
+UPDATES_IN_FLIGHT = REGISTRY.register(Gauge(
+    'arbbot_updates_in_flight', 'Handlers do Telegram rodando agora'))
+OUTBOX_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'arbbot_outbox_wait_seconds', 'Espera na fila de envio ao Telegram', ['priority']))
+OUTBOX_PENDING = REGISTRY.register(Gauge(
+    'arbbot_outbox_pending', 'Envios ao Telegram aguardando na fila'))
+OUTBOX_EVENTS = REGISTRY.register(Counter(
+    'arbbot_outbox_events_total', 'Edições fundidas, 429 recebidos e envios descartados', ['event']))
+TELEGRAM_SEND_SECONDS = REGISTRY.register(Histogram(
+    'arbbot_telegram_send_seconds', 'Ida e volta das chamadas à API do Telegram', ['method']))
+
+
+def cache_hit_rate() -> Optional[float]:
+    hits = ODDS_CACHE_REQUESTS.labels('hit').value
+    misses = ODDS_CACHE_REQUESTS.labels('miss').value
+    if hits + misses == 0:
+        return None
+    return hits / (hits + misses)
+
+
+def summary() -> str:
+    """Resumo de uma linha para o log"""
+    def average_ms(histogram: Histogram) -> str:
+        count, total = histogram.merged()
+        return f"{total / count * 1000:.0f}ms (n={count})" if count else "-"
+
+    hit_rate = cache_hit_rate()
+    return (
+        f"busca de odds {average_ms(ODDS_FETCH_SECONDS)}, "
+        f"cálculo {average_ms(ARBITRAGE_COMPUTE_SECONDS)}, "
+        f"updates {average_ms(UPDATE_SECONDS)}, "
+        f"envio {average_ms(TELEGRAM_SEND_SECONDS)}, "
+        f"cache {'-' if hit_rate is None else f'{hit_rate:.0%}'}, "
+        f"cota restante {API_QUOTA_REMAINING.value:.0f}, "
+        f"oportunidades {OPPORTUNITIES_CURRENT.value:.0f}"
+    )
+
+
+class MetricsServer:
+    """Endpoint HTTP local /metrics e resumo periódico no log"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 9108,
+                 log_interval: float = 0.0, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.log_interval = log_interval
+        self.registry = registry
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._log_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.port:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            logger.info(f"Métricas em http://{self.host}:{self.port}/metrics")
+        if self.log_interval > 0:
+            self._log_task = asyncio.create_task(self._log_loop())
+
+    async def stop(self) -> None:
+        if self._log_task is not None:
+            self._log_task.cancel()
+            self._log_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            # Descarta os cabeçalhos da requisição
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Erro no endpoint de métricas: {e}")
+        finally:
+            writer.close()
+
+    async def _log_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.log_interval)
+            logger.info(f"Métricas: {summary()}")
@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class CacheEntry:
+    """Resposta da API guardada em cache"""
+
+    __slots__ = ('data', 'fetched_at', 'expires_at', 'failed', '_clock')
+
+    def __init__(self, data: Any, fetched_at: float, expires_at: float,
+                 clock: Callable[[], float] = time.monotonic, failed: bool = False):
+        self.data = data
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+        self.failed = failed  # Sem resposta nova (erro, tempo ou cota esgotados): data vazio ou antigo
+        self._clock = clock
+
+    @property
+    def age(self) -> float:
+        """Idade da resposta em segundos"""
+        return max(0.0, self._clock() - self.fetched_at)
+
+    @property
+    def fresh(self) -> bool:
+        return self._clock() < self.expires_at
+
+
+class QuotaTracker:
+    """Acompanha a cota da API pelos cabeçalhos x-requests-remaining/x-requests-used"""
+
+    def __init__(self, max_multiplier: float = 10.0, comfortable_fraction: float = 0.5):
+        self.remaining: Optional[int] = None
+        self.used: Optional[int] = None
+        self.max_multiplier = max_multiplier
+        self.comfortable_fraction = comfortable_fraction
+
+    def update(self, headers) -> None:
+        """Atualiza a cota a partir dos cabeçalhos de uma resposta"""
+        remaining = headers.get('x-requests-remaining')
+        used = headers.get('x-requests-used')
+        try:
+            if remaining is not None:
+                self.remaining = int(float(remaining))
+            if used is not None:
+                self.used = int(float(used))
+        except ValueError:
+            pass
+
+    @property
+    def remaining_fraction(self) -> Optional[float]:
+        if self.remaining is None or self.used is None:
+            return None
+        total = self.remaining + self.used
+        if total <= 0:
+            return None
+        return self.remaining / total
+
+    def ttl_multiplier(self) -> float:
+        """Fator aplicado ao TTL: cresce conforme a cota se esgota"""
+        fraction = self.remaining_fraction
+        if fraction is None or fraction >= self.comfortable_fraction:
+            return 1.0
+        if fraction <= 0:
+            return self.max_multiplier
+        return min(self.max_multiplier, self.comfortable_fraction / fraction)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.remaining is not None and self.remaining <= 0
+
+
+class OddsCache:
+    """Cache LRU com TTL compartilhado por todo o processo"""
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 128,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, allow_stale: bool = False) -> Optional[CacheEntry]:
+        """Retorna a entrada se ainda válida (ou vencida, se allow_stale)"""
+        entry = self._entries.get(key)
+        if entry is None or (not allow_stale and not entry.fresh):
+            if not allow_stale:
+                self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if not allow_stale:
+            self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, data: Any, ttl: Optional[float] = None) -> CacheEntry:
+        """Guarda uma resposta e descarta as menos usadas além do limite"""
+        now = self.clock()
+        entry = CacheEntry(data, now, now + (self.ttl if ttl is None else ttl), self.clock)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
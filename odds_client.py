@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import httpx
+
+from json_stream import iter_events
+from metrics import (API_QUOTA_REMAINING, API_QUOTA_USED, ODDS_CACHE_REQUESTS, ODDS_FETCH_ERRORS,
+                     ODDS_FETCH_SECONDS, ODDS_FIRST_EVENT_SECONDS)
+from odds_cache import CacheEntry, OddsCache, QuotaTracker
+from odds_store import OddsStore
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def parse_extra_markets(value: str) -> Dict[str, Tuple[str, ...]]:
+    """Lê mercados extras por esporte: 'basketball_nba=spreads,totals;*=totals'"""
+    extra = {}
+    for item in value.split(';'):
+        sport_key, _, markets = item.partition('=')
+        markets = tuple(m.strip() for m in markets.split(',') if m.strip())
+        if sport_key.strip() and markets:
+            extra[sport_key.strip()] = markets
+    return extra
+
+
+class CreditsExhausted(Exception):
+    """Orçamento de créditos esgotado para uma consulta fora da varredura"""
+
+
+class OddsClient:
+    """Cliente assíncrono da The Odds API com pool de conexões keep-alive"""
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        base_url: str = "https://api.the-odds-api.com/v4",
+        request_timeout: float = 15.0,
+        max_connections: int = 10,
+        regions: str = 'us,uk,eu',
+        markets: str = 'h2h',
+        cache: Optional[OddsCache] = None,
+        sports_ttl: float = 3600.0,
+        store: Optional[OddsStore] = None,
+        extra_markets: Optional[Dict[str, Sequence[str]]] = None,
+        streaming: bool = True,
+        on_event: Optional[Callable[[str, Dict], None]] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.request_timeout = request_timeout
+        self.max_connections = max_connections
+        self.regions = regions
+        self.markets = markets
+        self.extra_markets = extra_markets or {}  # esporte (ou '*') -> mercados além dos padrão
+        self.cache = cache if cache is not None else OddsCache()
+        self.sports_ttl = sports_ttl
+        self.quota = QuotaTracker()
+        self.flight = SingleFlight()
+        self.store = store  # Histórico opcional de todas as respostas de odds
+        self.streaming = streaming  # Decodifica /odds evento a evento conforme o corpo chega
+        self.on_event = on_event  # Chamado com cada evento assim que ele fica completo
+        self._client: Optional[httpx.AsyncClient] = None
+        self._writes: Set[asyncio.Task] = set()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Cria o cliente HTTP sob demanda (precisa de um event loop ativo)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.request_timeout, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=30.0,
+                ),
+            )
+        return self._client
+
+    async def close(self):
+        """Fecha o pool de conexões"""
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _update_quota(self, response: httpx.Response) -> None:
+        self.quota.update(response.headers)
+        if self.quota.remaining is not None:
+            API_QUOTA_REMAINING.set(self.quota.remaining)
+        if self.quota.used is not None:
+            API_QUOTA_USED.set(self.quota.used)
+
+    async def _get_json(self, path: str, params: Dict, timeout: float) -> httpx.Response:
+        params = {'apiKey': self.api_key, **params}
+        response = await self._get_client().get(path, params=params, timeout=timeout)
+        self._update_quota(response)
+        response.raise_for_status()
+        return response
+
+    async def _stream_events(self, sport_key: str, path: str, params: Dict) -> List[Dict]:
+        """Lê um array de eventos em streaming, guardando só os campos usados pelos motores"""
+        params = {'apiKey': self.api_key, **params}
+        started = time.perf_counter()
+        data = []
+        async with self._get_client().stream('GET', path, params=params,
+                                             timeout=self.request_timeout) as response:
+            self._update_quota(response)
+            response.raise_for_status()
+
+            async for event in iter_events(response.aiter_bytes()):
+                if not data:
+                    ODDS_FIRST_EVENT_SECONDS.labels(sport_key).observe(time.perf_counter() - started)
+                data.append(event)
+                if self.on_event is not None:
+                    try:
+                        self.on_event(sport_key, event)
+                    except Exception as e:
+                        logger.error(f"Erro ao processar evento de {sport_key}: {e}")
+        return data
+
+    def markets_for(self, sport_key: str) -> str:
+        """Mercados consultados para o esporte: os padrão mais os extras configurados"""
+        markets = self.markets.split(',')
+        markets += self.extra_markets.get('*', ())
+        markets += self.extra_markets.get(sport_key, ())
+        return ','.join(dict.fromkeys(markets))
+
+    def poll_cost(self, sport_key: str) -> int:
+        """Créditos gastos por consulta do esporte (regiões x mercados)"""
+        return len(self.regions.split(',')) * len(self.markets_for(sport_key).split(','))
+
+    @staticmethod
+    def event_cost(bookmakers: Sequence[str], markets: str) -> int:
+        """Créditos da consulta por evento: cada grupo de até 10 casas conta como uma região"""
+        return max(1, -(-len(bookmakers) // 10)) * len(markets.split(','))
+
+    def _odds_ttl(self) -> float:
+        """TTL das odds, mais longo quanto menor a cota restante"""
+        return self.cache.ttl * self.quota.ttl_multiplier()
+
+    async def get_sports(self) -> List[Dict]:
+        """Busca esportes disponíveis na API"""
+        key = ('sports',)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry.data
+
+        return await self.flight.do(key, self._refresh_sports)
+
+    async def _refresh_sports(self) -> List[Dict]:
+        key = ('sports',)
+        try:
+            params = {
+                'all': 'false'  # Apenas esportes ativos
+            }
+            response = await self._get_json("/sports", params, timeout=10)
+            return self.cache.put(key, response.json(), ttl=self.sports_ttl).data
+
+        except Exception as e:
+            logger.error(f"Erro ao buscar esportes: {e}")
+            stale = self.cache.get(key, allow_stale=True)
+            return stale.data if stale is not None else []
+
+    async def fetch_odds(self, sport_key: str, regions: Optional[str] = None,
+                         markets: Optional[str] = None) -> CacheEntry:
+        """Busca odds de um esporte, servindo do cache quando possível"""
+        regions = regions or self.regions
+        markets = markets or self.markets_for(sport_key)
+        key = (sport_key, regions, markets)
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            ODDS_CACHE_REQUESTS.labels('hit').inc()
+            return entry
+
+        ODDS_CACHE_REQUESTS.labels('miss').inc()
+        # Usuários simultâneos compartilham a mesma requisição
+        return await self.flight.do(key, lambda: self._refresh_odds(sport_key, key))
+
+    async def _refresh_odds(self, sport_key: str, key: tuple) -> CacheEntry:
+        _, regions, markets = key
+        stale = self.cache.get(key, allow_stale=True)
+        if stale is not None and self.quota.exhausted:
+            logger.warning(f"Cota da API esgotada, usando odds antigas para {sport_key}")
+            return self._failed_entry(stale)
+
+        try:
+            params = {
+                'regions': regions,  # Múltiplas regiões para mais casas
+                'markets': markets,  # h2h (1x2 ou moneyline) e os extras do esporte
+                'oddsFormat': 'decimal',
+                'dateFormat': 'iso'
+            }
+            with ODDS_FETCH_SECONDS.labels(sport_key).time():
+                if self.streaming:
+                    data = await self._stream_events(sport_key, f"/sports/{sport_key}/odds", params)
+                else:
+                    response = await self._get_json(f"/sports/{sport_key}/odds", params,
+                                                     timeout=self.request_timeout)
+                    data = response.json()
+            self._record(sport_key, regions, markets, data)
+            return self.cache.put(key, data, ttl=self._odds_ttl())
+
+        except Exception as e:
+            ODDS_FETCH_ERRORS.labels(sport_key).inc()
+            logger.error(f"Erro ao buscar odds para {sport_key}: {e}")
+            return self._failed_entry(stale)
+
+    async def get_event_odds(self, sport_key: str, event_id: str, bookmakers: Iterable[str],
+                             markets: Optional[str] = None, ttl: float = 15.0,
+                             spend: Optional[Callable[[int], bool]] = None) -> Optional[Dict]:
+        """Odds de um único evento, só das casas informadas (custa bem menos que o esporte todo)
+
+        spend(créditos) é chamado só quando a consulta vai à API; se retornar False a consulta
+        não é feita e CreditsExhausted é lançada. Retorna None se o evento não existe mais;
+        outras falhas são propagadas.
+        """
+        markets = markets or self.markets
+        unique = sorted(set(bookmakers))
+        bookmakers = ','.join(unique)
+        key = ('event', sport_key, event_id, bookmakers, markets)
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry.data
+
+        async def refresh() -> Optional[Dict]:
+            if spend is not None and not spend(self.event_cost(unique, markets)):
+                raise CreditsExhausted(f"Sem créditos para consultar o evento {event_id}")
+            params = {
+                'bookmakers': bookmakers,  # Casas explícitas no lugar das regiões
+                'markets': markets,
+                'oddsFormat': 'decimal',
+                'dateFormat': 'iso'
+            }
+            try:
+                with ODDS_FETCH_SECONDS.labels(sport_key).time():
+                    response = await self._get_json(f"/sports/{sport_key}/events/{event_id}/odds",
+                                                     params, timeout=self.request_timeout)
+                    data = response.json()
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code in (404, 422):
+                    data = None  # Evento começou ou foi retirado
+                else:
+                    ODDS_FETCH_ERRORS.labels(sport_key).inc()
+                    raise
+            return self.cache.put(key, data, ttl=ttl).data
+
+        return await self.flight.do(key, refresh)
+
+    def _record(self, sport_key: str, regions: str, markets: str, data: List[Dict]) -> None:
+        """Grava a resposta no histórico em uma thread, sem atrasar quem pediu"""
+        if self.store is None:
+            return
+        task = asyncio.ensure_future(
+            asyncio.to_thread(self.store.append, sport_key, regions, markets, data, time.time())
+        )
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def get_odds(self, sport_key: str, regions: Optional[str] = None,
+                       markets: Optional[str] = None) -> List[Dict]:
+        """Busca odds para um esporte específico"""
+        entry = await self.fetch_odds(sport_key, regions, markets)
+        return entry.data
+
+    def _failed_entry(self, stale: Optional[CacheEntry] = None) -> CacheEntry:
+        """Resposta que não veio da API agora: as odds antigas, se houver, marcadas como falha"""
+        if stale is not None:
+            return CacheEntry(stale.data, stale.fetched_at, stale.expires_at, self.cache.clock, failed=True)
+        now = self.cache.clock()
+        return CacheEntry([], now, now, self.cache.clock, failed=True)
+
+    async def get_odds_many(self, sport_keys: Iterable[str],
+                            budget: Optional[float] = None) -> Dict[str, CacheEntry]:
+        """Busca odds de vários esportes em paralelo dentro de um orçamento de tempo"""
+        tasks = {
+            sport: asyncio.create_task(self.fetch_odds(sport))
+            for sport in dict.fromkeys(sport_keys)
+        }
+        if not tasks:
+            return {}
+
+        done, pending = await asyncio.wait(tasks.values(), timeout=budget)
+
+        # Esportes lentos não seguram a busca inteira
+        for task in pending:
+            task.cancel()
+
+        results = {}
+        for sport, task in tasks.items():
+            if task in done:
+                results[sport] = task.result()
+            else:
+                logger.warning(f"Tempo esgotado ao buscar odds para {sport}")
+                results[sport] = self._failed_entry()
+        return results
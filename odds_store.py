@@ -0,0 +1,403 @@
+import bisect
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from scheduler import parse_iso
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ODS1'
+# magic, timestamp, eventos, cotações, bytes das strings, bytes das colunas
+BLOCK_HEADER = struct.Struct('<4sdIIII')
+# timestamp, hash do esporte, hash do evento, offset do bloco, tamanho do bloco
+INDEX_RECORD = struct.Struct('<dIIQI')
+
+EVENT_COLUMNS = ('id', 'home', 'away', 'title', 'commence')  # índices de string
+QUOTE_INT_COLUMNS = ('event', 'bookmaker_key', 'bookmaker_title', 'market', 'outcome')
+QUOTE_FLOAT_COLUMNS = ('last_update', 'price', 'point')
+
+
+def _hash(value: str) -> int:
+    return zlib.crc32(value.encode())
+
+
+def _epoch(value: str) -> float:
+    moment = parse_iso(value)
+    return moment.timestamp() if moment is not None else math.nan
+
+
+def _iso(epoch: float) -> str:
+    if math.isnan(epoch):
+        return ''  # last_update ausente ou inválido na resposta original
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _to_bytes(column: array) -> bytes:
+    if sys.byteorder != 'little':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_bytes(typecode: str, data) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column
+
+
+class StoredSnapshot(NamedTuple):
+    """Uma resposta de get_odds gravada no histórico"""
+    timestamp: float
+    sport_key: str
+    regions: str
+    markets: str
+    games: List[Dict]
+
+
+class _Block:
+    """Bloco decodificado: tabela de strings e colunas"""
+
+    __slots__ = ('timestamp', 'strings', 'events', 'quotes')
+
+    def __init__(self, timestamp: float, strings: List[str], events: Dict[str, array],
+                 quotes: Dict[str, array]):
+        self.timestamp = timestamp
+        self.strings = strings
+        self.events = events
+        self.quotes = quotes
+
+    def to_snapshot(self, event_id: Optional[str] = None) -> StoredSnapshot:
+        """Remonta os jogos no formato da API, na ordem original"""
+        s = self.strings
+        events, quotes = self.events, self.quotes
+        games = []
+        for i in range(len(events['id'])):
+            games.append({
+                'id': s[events['id'][i]],
+                'sport_key': s[0],
+                'sport_title': s[events['title'][i]],
+                'commence_time': s[events['commence'][i]],
+                'home_team': s[events['home'][i]],
+                'away_team': s[events['away'][i]],
+                'bookmakers': []
+            })
+
+        last = None
+        market = None
+        for row in range(len(quotes['event'])):
+            game = games[quotes['event'][row]]
+            bookmaker_key = quotes['bookmaker_key'][row]
+            market_key = quotes['market'][row]
+            group = (quotes['event'][row], bookmaker_key, market_key)
+
+            if last is None or group[:2] != last[:2]:
+                game['bookmakers'].append({
+                    'key': s[bookmaker_key],
+                    'title': s[quotes['bookmaker_title'][row]],
+                    'last_update': _iso(quotes['last_update'][row]),
+                    'markets': []
+                })
+            if last is None or group != last:
+                market = {'key': s[market_key], 'outcomes': []}
+                game['bookmakers'][-1]['markets'].append(market)
+            last = group
+
+            outcome = {'name': s[quotes['outcome'][row]], 'price': quotes['price'][row]}
+            point = quotes['point'][row]
+            if not math.isnan(point):
+                outcome['point'] = point
+            market['outcomes'].append(outcome)
+
+        if event_id is not None:
+            games = [game for game in games if game['id'] == event_id]
+        return StoredSnapshot(self.timestamp, s[0], s[1], s[2], games)
+
+
+def encode_block(timestamp: float, sport_key: str, regions: str, markets: str,
+                 games: List[Dict]) -> Tuple[bytes, List[str]]:
+    """Serializa uma resposta da API em um bloco colunar comprimido"""
+    strings: List[str] = []
+    lookup: Dict[str, int] = {}
+
+    def intern(value) -> int:
+        value = '' if value is None else str(value)
+        index = lookup.get(value)
+        if index is None:
+            index = lookup[value] = len(strings)
+            strings.append(value)
+        return index
+
+    for value in (sport_key, regions, markets):
+        strings.append(value)  # Posições fixas 0, 1 e 2
+    event_columns = {name: array('I') for name in EVENT_COLUMNS}
+    int_columns = {name: array('I') for name in QUOTE_INT_COLUMNS}
+    float_columns = {name: array('d') for name in QUOTE_FLOAT_COLUMNS}
+    event_ids = []
+
+    for game in games:
+        event = len(event_columns['id'])
+        event_ids.append(str(game.get('id', '')))
+        event_columns['id'].append(intern(game.get('id', '')))
+        event_columns['home'].append(intern(game.get('home_team', '')))
+        event_columns['away'].append(intern(game.get('away_team', '')))
+        event_columns['title'].append(intern(game.get('sport_title', '')))
+        event_columns['commence'].append(intern(game.get('commence_time', '')))
+
+        for bookmaker in game.get('bookmakers', []):
+            bookmaker_key = intern(bookmaker.get('key') or bookmaker.get('title'))
+            bookmaker_title = intern(bookmaker.get('title'))
+            last_update = _epoch(bookmaker.get('last_update', ''))
+
+            for market in bookmaker.get('markets', []):
+                market_key = intern(market.get('key'))
+                for outcome in market.get('outcomes', []):
+                    int_columns['event'].append(event)
+                    int_columns['bookmaker_key'].append(bookmaker_key)
+                    int_columns['bookmaker_title'].append(bookmaker_title)
+                    int_columns['market'].append(market_key)
+                    int_columns['outcome'].append(intern(outcome.get('name')))
+                    float_columns['last_update'].append(last_update)
+                    float_columns['price'].append(float(outcome['price']))
+                    float_columns['point'].append(float(outcome.get('point', math.nan)))
+
+    strings_blob = zlib.compress('\0'.join(strings).encode(), 6)
+    columns_blob = zlib.compress(b''.join(
+        _to_bytes(column) for column in (
+            *event_columns.values(), *int_columns.values(), *float_columns.values()
+        )
+    ), 6)
+    header = BLOCK_HEADER.pack(MAGIC, timestamp, len(event_columns['id']),
+                               len(int_columns['event']), len(strings_blob), len(columns_blob))
+    return header + strings_blob + columns_blob, event_ids
+
+
+def decode_block(data) -> _Block:
+    """Decodifica um bloco (sem JSON: só zlib e arrays tipados)"""
+    magic, timestamp, n_events, n_quotes, strings_len, columns_len = BLOCK_HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Bloco de odds inválido")
+
+    offset = BLOCK_HEADER.size
+    strings = zlib.decompress(data[offset:offset + strings_len]).decode().split('\0')
+    offset += strings_len
+    columns = memoryview(zlib.decompress(data[offset:offset + columns_len]))
+
+    position = 0
+
+    def take(typecode: str, count: int) -> array:
+        nonlocal position
+        size = array(typecode).itemsize * count
+        column = _from_bytes(typecode, columns[position:position + size])
+        position += size
+        return column
+
+    events = {name: take('I', n_events) for name in EVENT_COLUMNS}
+    quotes = {name: take('I', n_quotes) for name in QUOTE_INT_COLUMNS}
+    quotes.update({name: take('d', n_quotes) for name in QUOTE_FLOAT_COLUMNS})
+    return _Block(timestamp, strings, events, quotes)
+
+
+class _TimeView:
+    """Sequência de timestamps do índice mapeado em memória (para bisect)"""
+
+    def __init__(self, index: mmap.mmap):
+        self.index = index
+
+    def __len__(self) -> int:
+        return len(self.index) // INDEX_RECORD.size
+
+    def __getitem__(self, i: int) -> float:
+        return INDEX_RECORD.unpack_from(self.index, i * INDEX_RECORD.size)[0]
+
+
+class OddsStore:
+    """Histórico append-only de odds em segmentos colunares comprimidos"""
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 max_bytes: int = 1024 * 1024 * 1024, retention_days: float = 30.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._catalog_path = os.path.join(directory, 'sports.txt')
+        self._sports: Dict[int, str] = {}
+        if os.path.exists(self._catalog_path):
+            with open(self._catalog_path, encoding='utf-8') as catalog:
+                for line in catalog:
+                    sport_key = line.strip()
+                    if sport_key:
+                        self._sports[_hash(sport_key)] = sport_key
+
+        segments = self.segments()
+        self._segment = segments[-1] if segments else 1
+
+    def _path(self, segment: int, extension: str) -> str:
+        return os.path.join(self.directory, f"{segment:08d}.{extension}")
+
+    def segments(self) -> List[int]:
+        """Números dos segmentos existentes, do mais antigo ao mais novo"""
+        return sorted(
+            int(name.split('.')[0]) for name in os.listdir(self.directory)
+            if name.endswith('.dat') and name.split('.')[0].isdigit()
+        )
+
+    def sports(self) -> List[str]:
+        """Esportes já gravados"""
+        return sorted(self._sports.values())
+
+    def time_range(self, sport_key: Optional[str] = None) -> Optional[Tuple[float, float]]:
+        """Primeiro e último timestamp gravados, lidos só dos índices"""
+        sport_hash = _hash(sport_key) if sport_key is not None else None
+        first = last = None
+        for segment in self.segments():
+            path = self._path(segment, 'idx')
+            if not os.path.exists(path) or os.path.getsize(path) < INDEX_RECORD.size:
+                continue
+            with open(path, 'rb') as index:
+                for timestamp, sport, _, _, _ in INDEX_RECORD.iter_unpack(index.read()):
+                    if sport_hash is not None and sport != sport_hash:
+                        continue
+                    first = timestamp if first is None else min(first, timestamp)
+                    last = timestamp if last is None else max(last, timestamp)
+        return (first, last) if first is not None else None
+
+    def append(self, sport_key: str, regions: str, markets: str, games: List[Dict],
+               timestamp: Optional[float] = None) -> None:
+        """Grava uma resposta de get_odds (erros são apenas registrados no log)"""
+        timestamp = timestamp if timestamp is not None else time.time()
+        try:
+            block, event_ids = encode_block(timestamp, sport_key, regions, markets, games)
+            with self._lock:
+                self._write(sport_key, block, event_ids, timestamp)
+        except Exception as e:
+            logger.error(f"Erro ao gravar histórico de {sport_key}: {e}")
+
+    def _write(self, sport_key: str, block: bytes, event_ids: List[str], timestamp: float) -> None:
+        data_path = self._path(self._segment, 'dat')
+        if os.path.exists(data_path) and os.path.getsize(data_path) + len(block) > self.segment_bytes:
+            self._segment += 1
+            data_path = self._path(self._segment, 'dat')
+            self._apply_retention()
+
+        with open(data_path, 'ab') as data:
+            offset = data.tell()
+            data.write(block)
+
+        sport_hash = _hash(sport_key)
+        records = [
+            INDEX_RECORD.pack(timestamp, sport_hash, _hash(event_id), offset, len(block))
+            for event_id in event_ids or ['']
+        ]
+        self._append_index(self._path(self._segment, 'idx'), b''.join(records), timestamp)
+
+        if sport_hash not in self._sports:
+            self._sports[sport_hash] = sport_key
+            with open(self._catalog_path, 'a', encoding='utf-8') as catalog:
+                catalog.write(sport_key + '\n')
+
+    @staticmethod
+    def _append_index(path: str, records: bytes, timestamp: float) -> None:
+        """Acrescenta registros mantendo o índice em ordem de tempo (a leitura usa bisect)
+
+        Gravações em threads podem chegar fora de ordem; elas são raras e ficam perto do
+        fim, então basta recuar alguns registros e regravar a cauda.
+        """
+        with open(path, 'r+b' if os.path.exists(path) else 'w+b') as index:
+            end = index.seek(0, os.SEEK_END)
+            end -= end % INDEX_RECORD.size  # Ignora um registro incompleto
+            position = end
+            while position >= INDEX_RECORD.size:
+                index.seek(position - INDEX_RECORD.size)
+                previous, = struct.unpack('<d', index.read(8))
+                if previous <= timestamp:
+                    break
+                position -= INDEX_RECORD.size
+            index.seek(position)
+            tail = index.read(end - position)
+            index.seek(position)
+            index.write(records + tail)
+
+    def _apply_retention(self) -> None:
+        """Remove os segmentos mais antigos além do tamanho total ou da idade máxima"""
+        segments = [segment for segment in self.segments() if segment != self._segment]
+        sizes = {
+            segment: os.path.getsize(self._path(segment, 'dat'))
+            + (os.path.getsize(self._path(segment, 'idx')) if os.path.exists(self._path(segment, 'idx')) else 0)
+            for segment in segments
+        }
+        total = sum(sizes.values())
+        oldest_allowed = time.time() - self.retention_days * 86400
+
+        for segment in segments:
+            expired = os.path.getmtime(self._path(segment, 'dat')) < oldest_allowed
+            if not expired and total <= self.max_bytes:
+                break
+            for extension in ('dat', 'idx'):
+                path = self._path(segment, extension)
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= sizes[segment]
+            logger.info(f"Segmento de histórico {segment} removido")
+
+    def snapshots(self, sport_key: Optional[str] = None, event_id: Optional[str] = None,
+                  start: Optional[float] = None, end: Optional[float] = None) -> Iterator[StoredSnapshot]:
+        """Respostas gravadas entre start e end (epoch), filtradas por esporte/evento"""
+        for block in self.blocks(sport_key, event_id, start, end):
+            snapshot = block.to_snapshot(event_id)
+            if sport_key is not None and snapshot.sport_key != sport_key:
+                continue  # Colisão de hash
+            if event_id is not None and not snapshot.games:
+                continue
+            yield snapshot
+
+    def blocks(self, sport_key: Optional[str] = None, event_id: Optional[str] = None,
+               start: Optional[float] = None, end: Optional[float] = None) -> Iterator[_Block]:
+        """Blocos decodificados (colunas) que atendem aos filtros, em ordem de tempo"""
+        sport_hash = _hash(sport_key) if sport_key is not None else None
+        event_hash = _hash(event_id) if event_id is not None else None
+
+        for segment in self.segments():
+            for offset, length in self._scan_index(segment, sport_hash, event_hash, start, end):
+                with open(self._path(segment, 'dat'), 'rb') as data:
+                    with mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        yield decode_block(mapped[offset:offset + length])
+
+    def _scan_index(self, segment: int, sport_hash: Optional[int], event_hash: Optional[int],
+                    start: Optional[float], end: Optional[float]) -> List[Tuple[int, int]]:
+        path = self._path(segment, 'idx')
+        if not os.path.exists(path) or os.path.getsize(path) < INDEX_RECORD.size:
+            return []
+
+        found: List[Tuple[int, int]] = []
+        seen: Set[int] = set()
+        with open(path, 'rb') as index_file:
+            with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+                view = _TimeView(index)
+                first = bisect.bisect_left(view, start) if start is not None else 0
+                last = bisect.bisect_right(view, end) if end is not None else len(view)
+
+                for i in range(first, last):
+                    _, sport, event, offset, length = INDEX_RECORD.unpack_from(index, i * INDEX_RECORD.size)
+                    if sport_hash is not None and sport != sport_hash:
+                        continue
+                    if event_hash is not None and event != event_hash:
+                        continue
+                    if offset not in seen:
+                        seen.add(offset)
+                        found.append((offset, length))
+        return found
@@ -0,0 +1,314 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from telegram.error import RetryAfter
+
+from metrics import OUTBOX_EVENTS, OUTBOX_PENDING, OUTBOX_WAIT_SECONDS, TELEGRAM_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0  # Respostas a cliques e comandos
+ALERT = 1  # Alertas em massa
+PRIORITY_NAMES = ('interactive', 'alert')
+
+
+class TokenBucket:
+    """Balde de fichas: `rate` envios por segundo com rajadas de até `capacity`"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Segundos até haver uma ficha (0 se já houver)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Send:
+    __slots__ = ('call', 'method', 'priority', 'key', 'futures', 'queued_at', 'attempts')
+
+    def __init__(self, call: Callable[[], Awaitable[Any]], method: str, priority: int,
+                 key: Optional[Hashable], future: asyncio.Future, queued_at: float):
+        self.call = call
+        self.method = method
+        self.priority = priority
+        self.key = key
+        self.futures = [future]  # Chamadores de envios fundidos neste
+        self.queued_at = queued_at
+        self.attempts = 0
+
+
+class _Chat:
+    __slots__ = ('bucket', 'queues', 'keyed', 'blocked_until', 'busy', 'version')
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.queues: Tuple[Deque[_Send], ...] = (deque(), deque())  # Por prioridade
+        self.keyed: Dict[Hashable, _Send] = {}  # Envios pendentes que podem ser substituídos
+        self.blocked_until = 0.0  # retry_after recebido do Telegram
+        self.busy = False  # Um envio por vez por chat, para manter a ordem
+        self.version = -1  # Invalida entradas antigas nos heaps
+
+    def head(self) -> Optional[_Send]:
+        for queue in self.queues:
+            if queue:
+                return queue[0]
+        return None
+
+
+class Outbox:
+    """Fila de envio ao Telegram com limites global e por chat
+
+    Respostas interativas passam na frente de alertas, edições ainda não enviadas da
+    mesma mensagem são substituídas pela mais recente e um 429 (RetryAfter) pausa o
+    chat pelo tempo pedido antes de reenviar.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: float = 3.0,
+        max_concurrent: int = 8,
+        max_retries: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate  # Grupos (chat_id negativo) têm limite menor
+        self.chat_burst = chat_burst
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.clock = clock
+
+        self._global = TokenBucket(global_rate, max(global_rate, 1.0), clock())
+        self._chats: Dict[int, _Chat] = {}
+        self._timers: List[Tuple[float, int, int, int]] = []  # (liberado em, seq, chat, versão)
+        self._ready: List[Tuple[int, int, int, int]] = []  # (prioridade, seq, chat, versão)
+        self._order = itertools.count()
+        self._pending = 0
+        self._in_flight = 0
+        self._sends: set = set()
+        self._swept_at = clock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        """Inicia o despachante no event loop atual"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Interrompe o despachante; envios pendentes são cancelados"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        sends = list(self._sends)
+        for task in sends:
+            task.cancel()
+        # Os envios interrompidos cancelam os próprios futures no finally de _deliver
+        await asyncio.gather(*sends, return_exceptions=True)
+        for chat in self._chats.values():
+            for queue in chat.queues:
+                for send in queue:
+                    for future in send.futures:
+                        future.cancel()
+        self._chats.clear()
+        self._timers.clear()
+        self._ready.clear()
+        self._pending = 0
+        OUTBOX_PENDING.set(0)
+
+    def submit(self, chat_id: int, call: Callable[[], Awaitable[Any]], method: str,
+               priority: int = INTERACTIVE, key: Optional[Hashable] = None) -> asyncio.Future:
+        """Enfileira call() e retorna um Future com o resultado
+
+        Com `key`, um envio pendente do mesmo chat e mesma chave (ex.: edição da mesma
+        mensagem) é substituído por este; os dois chamadores recebem o mesmo resultado.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        # Erros chegam a quem aguarda; envios sem ninguém esperando não geram aviso no log
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        now = self.clock()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            chat = self._chats[chat_id] = _Chat(TokenBucket(rate, self.chat_burst, now))
+
+        pending = chat.keyed.get(key) if key is not None else None
+        if pending is not None:
+            pending.call = call
+            pending.method = method
+            pending.futures.append(future)
+            OUTBOX_EVENTS.labels('coalesced').inc()
+            if priority < pending.priority:
+                chat.queues[pending.priority].remove(pending)
+                pending.priority = priority
+                chat.queues[priority].append(pending)
+                self._schedule(chat_id, chat)
+            return future
+
+        send = _Send(call, method, priority, key, future, now)
+        chat.queues[priority].append(send)
+        if key is not None:
+            chat.keyed[key] = send
+        self._pending += 1
+        OUTBOX_PENDING.set(self._pending)
+        self._schedule(chat_id, chat)
+        return future
+
+    def _schedule(self, chat_id: int, chat: _Chat) -> None:
+        """Agenda o chat para quando o balde dele (ou o retry_after) liberar"""
+        if chat.busy or chat.head() is None:
+            return
+        now = self.clock()
+        chat.version = next(self._order)
+        ready_at = max(now + chat.bucket.delay(now), chat.blocked_until)
+        heapq.heappush(self._timers, (ready_at, next(self._order), chat_id, chat.version))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            now = self.clock()
+            if now - self._swept_at >= 60:
+                self._sweep(now)
+            while self._timers and self._timers[0][0] <= now:
+                _, seq, chat_id, version = heapq.heappop(self._timers)
+                chat = self._chats.get(chat_id)
+                if chat is not None and chat.version == version and not chat.busy:
+                    heapq.heappush(self._ready, (chat.head().priority, seq, chat_id, version))
+
+            wait = self._timers[0][0] - now if self._timers else None
+            if self._ready and self._in_flight < self.max_concurrent:
+                global_delay = self._global.delay(now)
+                if global_delay == 0:
+                    self._dispatch(now)
+                    continue
+                wait = global_delay if wait is None else min(wait, global_delay)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, now: float) -> None:
+        _, _, chat_id, version = heapq.heappop(self._ready)
+        chat = self._chats.get(chat_id)
+        if chat is None or chat.version != version or chat.busy:
+            return
+        send = chat.head()
+        if send is None:
+            return
+
+        chat.queues[send.priority].popleft()
+        if send.key is not None and chat.keyed.get(send.key) is send:
+            del chat.keyed[send.key]
+        chat.busy = True
+        chat.bucket.take(now)
+        self._global.take(now)
+        self._in_flight += 1
+        if send.attempts == 0:
+            OUTBOX_WAIT_SECONDS.labels(PRIORITY_NAMES[send.priority]).observe(now - send.queued_at)
+
+        task = asyncio.create_task(self._deliver(chat_id, chat, send))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _deliver(self, chat_id: int, chat: _Chat, send: _Send) -> None:
+        requeued = False
+        try:
+            with TELEGRAM_SEND_SECONDS.labels(send.method).time():
+                result = await send.call()
+        except RetryAfter as e:
+            OUTBOX_EVENTS.labels('retry_after').inc()
+            send.attempts += 1
+            chat.blocked_until = self.clock() + float(e.retry_after)
+            if send.attempts <= self.max_retries:
+                logger.warning(f"Limite do Telegram no chat {chat_id}: nova tentativa em {e.retry_after}s")
+                requeued = self._requeue(chat, send)
+            else:
+                OUTBOX_EVENTS.labels('dropped').inc()
+                self._settle(send, error=e)
+        except Exception as e:
+            self._settle(send, error=e)
+        else:
+            self._settle(send, result=result)
+        finally:
+            if not requeued:
+                # Interrompido (ex.: stop()) sem resultado: quem aguarda não pode ficar preso
+                for future in send.futures:
+                    if not future.done():
+                        future.cancel()
+                self._pending -= 1
+                OUTBOX_PENDING.set(self._pending)
+            chat.busy = False
+            self._in_flight -= 1
+            if chat.head() is not None:
+                self._schedule(chat_id, chat)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _requeue(self, chat: _Chat, send: _Send) -> bool:
+        """Devolve o envio à frente da fila; False se uma versão mais nova já o substitui"""
+        newer = chat.keyed.get(send.key) if send.key is not None else None
+        if newer is not None:
+            newer.futures.extend(send.futures)
+            send.futures = []  # Agora pertencem à versão mais nova; o finally não os cancela
+            return False
+        chat.queues[send.priority].appendleft(send)
+        if send.key is not None:
+            chat.keyed[send.key] = send
+        return True
+
+    def _sweep(self, now: float) -> None:
+        """Esquece chats ociosos: sem fila e com o balde cheio não guardam estado útil"""
+        self._swept_at = now
+        idle = [
+            chat_id for chat_id, chat in self._chats.items()
+            if not chat.busy and chat.head() is None and chat.blocked_until <= now and chat.bucket.full(now)
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    @staticmethod
+    def _settle(send: _Send, result: Any = None, error: Optional[BaseException] = None) -> None:
+        for future in send.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import time
+import zlib
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from alert_filters import AlertFilter, AlertIndex
+from metrics import OPPORTUNITIES_CURRENT, OPPORTUNITIES_FOUND, SCAN_SECONDS, SPORTS_ACTIVE, SWEEP_SECONDS
+from odds_cache import CacheEntry
+from odds_client import OddsClient
+from scheduler import SportScheduler
+from singleflight import SingleFlight
+from snapshots import Opportunity, OpportunitySnapshot, SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(sport_key: str, shards: int) -> int:
+    """Shard fixo de um esporte (o mesmo em todos os processos)"""
+    return zlib.crc32(sport_key.encode()) % shards
+
+
+class ArbitrageScanner:
+    """Varredura periódica em segundo plano com alertas para os inscritos"""
+
+    def __init__(
+        self,
+        odds_client: OddsClient,
+        find_opportunities: Callable[[str, CacheEntry], Awaitable[List[Dict]]],
+        sports: Optional[List[str]] = None,
+        interval: float = 60.0,
+        budget: Optional[float] = None,
+        alert_ttl: float = 6 * 3600,
+        store: Optional[SnapshotStore] = None,
+        scheduler: Optional[SportScheduler] = None,
+        shard: Optional[Tuple[int, int]] = None,
+    ):
+        self.odds_client = odds_client
+        self.find_opportunities = find_opportunities
+        self.sports = sports  # Lista fixa opcional; por padrão todos os esportes ativos
+        self.shard = shard  # (índice, total): só os esportes deste shard
+        self.scheduler = scheduler if scheduler is not None else SportScheduler()
+        self.interval = interval
+        self.budget = budget
+        self.alert_ttl = alert_ttl  # Por quanto tempo não repetir o mesmo alerta
+        self.on_alert: Optional[Callable[[List[Opportunity]], Awaitable[None]]] = None
+
+        self.store = store if store is not None else SnapshotStore()
+        self.subscribers = AlertIndex()  # Inscritos e seus filtros de alerta
+        self._results: Dict[str, Tuple[float, List[Dict]]] = {}  # esporte -> (buscado em, oportunidades)
+
+        self._alerted: Dict[Hashable, float] = {}
+        self._flight = SingleFlight()
+        self._task: Optional[asyncio.Task] = None
+        self._alerts: Set[asyncio.Task] = set()  # Envios de alertas ainda em andamento
+
+    def is_fresh(self) -> bool:
+        """Se a última varredura ainda é recente o bastante para ser reaproveitada"""
+        latest = self.store.latest
+        if latest is None:
+            return False
+        return time.monotonic() - latest.created_at < 2 * self.interval
+
+    def sports_count(self) -> int:
+        """Esportes na varredura automática"""
+        return len(self.scheduler.stats)
+
+    async def get_latest(self) -> OpportunitySnapshot:
+        """Resultado da última varredura, varrendo agora se estiver desatualizado"""
+        if self.is_fresh():
+            return self.store.latest
+        return await self.scan_once()
+
+    async def scan_once(self) -> OpportunitySnapshot:
+        """Executa uma varredura (chamadas simultâneas compartilham a mesma)"""
+        return await self._flight.do('scan', self._scan)
+
+    async def active_sports(self) -> List[str]:
+        """Esportes a varrer: a lista fixa, se houver, ou os ativos na API (em cache)"""
+        if self.sports:
+            return self._in_shard(self.sports)
+
+        sports = await self.odds_client.get_sports()
+        active = [
+            sport['key'] for sport in sports
+            if sport.get('active', True) and not sport.get('has_outrights', False)
+        ]
+        return self._in_shard(active) or list(self.scheduler.stats)
+
+    def _in_shard(self, sports: List[str]) -> List[str]:
+        if self.shard is None:
+            return list(sports)
+        index, shards = self.shard
+        return [sport for sport in sports if shard_of(sport, shards) == index]
+
+    async def _scan(self) -> OpportunitySnapshot:
+        started = time.perf_counter()
+        tick = time.monotonic()
+
+        sports = await self.active_sports()
+        self.scheduler.set_sports(sports)
+        SPORTS_ACTIVE.set(len(sports))
+        for sport in list(self._results):
+            if sport not in self.scheduler.stats:
+                del self._results[sport]
+
+        # Só os esportes na vez, dentro do orçamento de créditos
+        due = self.scheduler.due()
+        odds_by_sport = await self.odds_client.get_odds_many(due, budget=self.budget)
+
+        for sport, entry in odds_by_sport.items():
+            if entry.failed:
+                # Sem resposta nova (mesmo com odds antigas do cache): mantém o último
+                # resultado e a vez do esporte na fila
+                continue
+            try:
+                opportunities = await self.find_opportunities(sport, entry) if entry.data else []
+                self._results[sport] = (entry.fetched_at, opportunities)
+                # Respostas servidas pelo cache não gastam créditos
+                self.scheduler.record(sport, entry.data, len(opportunities),
+                                      charged=entry.fetched_at >= tick)
+            except Exception as e:
+                logger.error(f"Erro ao processar {sport}: {e}")
+
+        # Sem ordenar tudo: o snapshot seleciona as melhores sob demanda
+        all_opportunities = [
+            opp for _, opportunities in self._results.values() for opp in opportunities
+        ]
+        fetched = [fetched_at for fetched_at, opportunities in self._results.values() if opportunities]
+
+        SCAN_SECONDS.observe(time.perf_counter() - started)
+        OPPORTUNITIES_CURRENT.set(len(all_opportunities))
+        if self.scheduler.last_sweep_seconds is not None:
+            SWEEP_SECONDS.set(self.scheduler.last_sweep_seconds)
+
+        # Uma única cópia compacta, compartilhada por todos os usuários
+        return self.store.publish(all_opportunities, min(fetched) if fetched else None)
+
+    def subscribe(self, chat_id: int, alert_filter: Optional[AlertFilter] = None) -> bool:
+        """Inscreve um chat nos alertas; retorna False se já estava inscrito"""
+        if chat_id in self.subscribers:
+            return False
+        self.subscribers.add(chat_id, alert_filter)
+        return True
+
+    def set_filter(self, chat_id: int, alert_filter: AlertFilter) -> None:
+        """Troca o filtro de um inscrito (sem efeito para quem não está inscrito)"""
+        if chat_id in self.subscribers:
+            self.subscribers.add(chat_id, alert_filter)
+
+    def unsubscribe(self, chat_id: int) -> bool:
+        """Remove um chat dos alertas; retorna False se não estava inscrito"""
+        if chat_id not in self.subscribers:
+            return False
+        self.subscribers.discard(chat_id)
+        return True
+
+    @staticmethod
+    def alert_key(opp: Opportunity) -> Hashable:
+        """Identifica uma oportunidade pelo jogo, mercado, linha e combinação de casas"""
+        legs = tuple(sorted((bet.outcome, bet.bookmaker) for bet in opp.bets))
+        return (opp.event_id or opp.game, opp.commence_time, opp.market, opp.point, legs)
+
+    def new_opportunities(self, opportunities: Iterable[Opportunity]) -> List[Opportunity]:
+        """Filtra as oportunidades que ainda não foram alertadas"""
+        now = time.monotonic()
+        self._alerted = {
+            key: seen for key, seen in self._alerted.items()
+            if now - seen < self.alert_ttl
+        }
+
+        fresh = []
+        for opp in opportunities:
+            key = self.alert_key(opp)
+            if key in self._alerted:
+                continue
+            self._alerted[key] = now
+            fresh.append(opp)
+        return fresh
+
+    def start(self) -> None:
+        """Inicia o loop de varredura no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Varredura automática a cada {self.interval:.0f}s")
+
+    async def stop(self) -> None:
+        """Interrompe o loop de varredura e os envios de alertas em andamento"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        alerts = list(self._alerts)
+        for task in alerts:
+            task.cancel()
+        await asyncio.gather(*alerts, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                snapshot = await self.scan_once()
+                fresh = self.new_opportunities(snapshot.opportunities)
+                OPPORTUNITIES_FOUND.inc(len(fresh))
+                if fresh and self.subscribers and self.on_alert is not None:
+                    # Em segundo plano: a entrega no ritmo do Telegram não atrasa a próxima varredura
+                    task = asyncio.create_task(self._alert(fresh))
+                    self._alerts.add(task)
+                    task.add_done_callback(self._alerts.discard)
+            except Exception as e:
+                logger.error(f"Erro na varredura automática: {e}")
+
+            await asyncio.sleep(self.interval)
+
+    async def _alert(self, opportunities: List[Opportunity]) -> None:
+        try:
+            await self.on_alert(opportunities)
+        except Exception as e:
+            logger.error(f"Erro ao enviar alertas: {e}")
@@ -0,0 +1,163 @@
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_iso(value: str) -> Optional[datetime]:
+    """Converte datas ISO da API (ex.: 2024-01-01T18:00:00Z)"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+
+class SportStats:
+    """Histórico de um esporte usado para priorizar as consultas"""
+
+    __slots__ = ('last_poll', 'next_poll', 'events_soon', 'hit_rate', 'polls')
+
+    def __init__(self):
+        self.last_poll: Optional[float] = None
+        self.next_poll = 0.0  # Nunca consultado: já está na vez
+        self.events_soon = 0
+        self.hit_rate = 0.0  # Média móvel de oportunidades por consulta
+        self.polls = 0
+
+
+class SportScheduler:
+    """Distribui consultas entre os esportes ativos dentro de um orçamento de créditos"""
+
+    def __init__(
+        self,
+        credits_per_hour: float = 60.0,
+        cost_per_poll: int = 3,
+        poll_cost: Optional[Callable[[str], int]] = None,
+        min_interval: float = 60.0,
+        max_interval: float = 6 * 3600,
+        soon_window: float = 6 * 3600,
+        soon_weight: float = 2.0,
+        hit_weight: float = 3.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.credits_per_hour = credits_per_hour
+        self.cost_per_poll = cost_per_poll
+        self.poll_cost = poll_cost  # Custo por esporte (mercados extras custam mais)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.soon_window = soon_window
+        self.soon_weight = soon_weight
+        self.hit_weight = hit_weight
+        self.clock = clock
+
+        self.stats: Dict[str, SportStats] = {}
+        self.last_sweep_seconds: Optional[float] = None
+        self._spent: Deque[Tuple[float, int]] = deque()  # (momento, créditos) na última hora
+        self._sweep_started: Optional[float] = None
+        self._sweep_pending: set = set()
+
+    def set_sports(self, sport_keys: Iterable[str]) -> None:
+        """Atualiza a lista de esportes ativos"""
+        active = list(dict.fromkeys(sport_keys))
+        for sport_key in active:
+            self.stats.setdefault(sport_key, SportStats())
+        for sport_key in list(self.stats):
+            if sport_key not in active:
+                del self.stats[sport_key]
+        self._sweep_pending &= set(active)
+
+    def priority(self, sport_key: str) -> float:
+        """Esportes com jogos próximos e histórico de arbitragens valem mais"""
+        stats = self.stats[sport_key]
+        soon = min(stats.events_soon, 10) / 10
+        return 1.0 + self.soon_weight * soon + self.hit_weight * min(stats.hit_rate, 1.0)
+
+    def cost(self, sport_key: str) -> int:
+        """Créditos gastos por uma consulta do esporte"""
+        cost = self.poll_cost(sport_key) if self.poll_cost is not None else self.cost_per_poll
+        return max(cost, 1)
+
+    def interval(self, sport_key: str) -> float:
+        """Intervalo entre consultas do esporte segundo sua fatia do orçamento"""
+        if self.credits_per_hour <= 0:
+            return self.max_interval
+
+        total_priority = sum(self.priority(key) for key in self.stats)
+        share = self.priority(sport_key) / total_priority
+        interval = 3600 * self.cost(sport_key) / (self.credits_per_hour * share)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def credits_available(self) -> float:
+        now = self.clock()
+        while self._spent and now - self._spent[0][0] >= 3600:
+            self._spent.popleft()
+        return self.credits_per_hour - sum(cost for _, cost in self._spent)
+
+    def spend(self, credits: int) -> bool:
+        """Debita créditos gastos fora da varredura (ex.: reconferências); False se não há saldo"""
+        if self.credits_available() < credits:
+            return False
+        self._spent.append((self.clock(), credits))
+        return True
+
+    def due(self) -> List[str]:
+        """Esportes na vez de serem consultados, limitados pelos créditos restantes"""
+        now = self.clock()
+        if self._sweep_started is None:
+            self._start_sweep(now)
+
+        waiting = [key for key, stats in self.stats.items() if stats.next_poll <= now]
+        waiting.sort(key=lambda key: (self.stats[key].next_poll, -self.priority(key)))
+
+        credits = self.credits_available()
+        if credits == float('inf'):
+            return waiting
+
+        due = []
+        for sport_key in waiting:
+            cost = self.cost(sport_key)
+            if cost > credits:
+                break  # Não deixa esportes mais baratos furarem a fila
+            credits -= cost
+            due.append(sport_key)
+        return due
+
+    def record(self, sport_key: str, odds_data: List[Dict], opportunities: int,
+               charged: bool = True) -> None:
+        """Registra o resultado de uma consulta e agenda a próxima"""
+        stats = self.stats.get(sport_key)
+        if stats is None:
+            return
+
+        now = self.clock()
+        if charged:
+            self._spent.append((now, self.cost(sport_key)))
+
+        horizon = datetime.now(timezone.utc) + timedelta(seconds=self.soon_window)
+        stats.events_soon = sum(
+            1 for game in odds_data
+            if (start := parse_iso(game.get('commence_time', ''))) is not None and start <= horizon
+        )
+        stats.hit_rate = 0.7 * stats.hit_rate + 0.3 * min(opportunities, 1)
+        stats.polls += 1
+        stats.last_poll = now
+        stats.next_poll = now + self.interval(sport_key)
+
+        self._sweep_pending.discard(sport_key)
+        if not self._sweep_pending:
+            self._finish_sweep(now)
+
+    def _start_sweep(self, now: float) -> None:
+        self._sweep_started = now
+        self._sweep_pending = set(self.stats)
+
+    def _finish_sweep(self, now: float) -> None:
+        if self._sweep_started is not None:
+            self.last_sweep_seconds = now - self._sweep_started
+            logger.info(
+                f"Varredura completa de {len(self.stats)} esportes em {self.last_sweep_seconds:.0f}s"
+            )
+        self._start_sweep(now)
@@ -0,0 +1,353 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import marshal
+import math
+import mmap
+import multiprocessing
+import os
+import signal
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from metrics import (OPPORTUNITIES_CURRENT, REGISTRY, SCANNER_WORKER_RESTARTS, SHARD_AGE_SECONDS,
+                     SPORTS_ACTIVE, RemoteMetrics)
+from scanner import ArbitrageScanner
+from snapshots import Bet, Opportunity, OpportunitySnapshot
+
+logger = logging.getLogger(__name__)
+
+# seq (ímpar durante a escrita), versão, odds mais antigas (epoch, NaN = nenhuma),
+# bytes das oportunidades, consultas feitas pelo processo, bytes das métricas do processo
+HEADER = struct.Struct('<QQdIII')
+_SEQ = struct.Struct('<Q')
+REGION_PREFIX = 'arbbot-'  # arbbot-<pid>-<n>-shard-<índice>
+_regions_in_use: Set[str] = set()  # Regiões abertas por este processo
+_region_ids = itertools.count()
+
+
+def shm_directory() -> str:
+    """/dev/shm (memória) quando existir; senão o diretório temporário"""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Existe, mas é de outro usuário
+    return True
+
+
+def remove_stale_regions(directory: str) -> int:
+    """Apaga regiões deixadas por um processo principal que terminou sem stop() (ex.: crash)
+
+    Em contêineres o PID costuma se repetir entre reinícios, então regiões com o PID atual
+    que este processo não está usando também são consideradas órfãs.
+    """
+    removed = 0
+    for name in os.listdir(directory):
+        pid = name[len(REGION_PREFIX):].split('-', 1)[0]
+        if not name.startswith(REGION_PREFIX) or not pid.isdigit():
+            continue
+        path = os.path.join(directory, name)
+        if path in _regions_in_use or (int(pid) != os.getpid() and _alive(int(pid))):
+            continue
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+            removed += 1
+    return removed
+
+
+def _encode(opportunities: Iterable[Opportunity]) -> bytes:
+    # Tuplas simples: o marshal não conhece NamedTuple
+    return marshal.dumps(tuple(
+        opp[:7] + (tuple(tuple(bet) for bet in opp.bets),) + opp[8:] for opp in opportunities
+    ))
+
+
+def _decode(rows: Tuple) -> Tuple[Opportunity, ...]:
+    intern = sys.intern
+    return tuple(
+        Opportunity(
+            row[0], row[1], intern(row[2]), row[3], row[4], row[5], row[6],
+            tuple(Bet(bet[0], intern(bet[1]), *bet[2:5], intern(bet[5]), bet[6]) for bet in row[7]),
+            intern(row[8]), intern(row[9]), row[10]
+        )
+        for row in rows
+    )
+
+
+class ShardData(NamedTuple):
+    """Última publicação lida de um processo de varredura"""
+    version: int
+    opportunities: Tuple[Opportunity, ...]
+    oldest_fetch: Optional[float]  # time.monotonic() deste processo
+    published_at: float  # time.monotonic() da leitura
+    polls: int
+    metrics: Dict  # Registry.state() do processo
+
+
+class _Region:
+    """Arquivo de tamanho fixo mapeado em memória, compartilhado entre processos"""
+
+    def __init__(self, path: str, size: int = 0):
+        self.path = path
+        if size:
+            with open(path, 'wb') as f:
+                f.truncate(size)
+        with open(path, 'r+b') as f:
+            self.mm = mmap.mmap(f.fileno(), 0)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.mm) - HEADER.size
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+class ShardWriter(_Region):
+    """Publica as oportunidades de um processo com um seqlock no cabeçalho
+
+    O seq fica ímpar enquanto a região é reescrita; quem lê descarta a leitura se o seq
+    mudou no meio. Um só escritor por região.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        seq, self.version = HEADER.unpack_from(self.mm)[:2]
+        self.seq = seq + (seq & 1)  # Escritor anterior pode ter morrido no meio
+
+    def publish(self, opportunities: Tuple[Opportunity, ...], oldest_fetch: Optional[float],
+                polls: int = 0, metrics: Optional[Dict] = None) -> int:
+        metrics_payload = marshal.dumps(metrics or {})
+        capacity = self.capacity - len(metrics_payload)
+        payload = _encode(opportunities)
+        if len(payload) > capacity:
+            # Sem espaço: mantém as maiores margens que couberem
+            ranked = sorted(opportunities, key=lambda opp: opp.profit_margin, reverse=True)
+            count = len(ranked)
+            while len(payload) > capacity and count:
+                count //= 2
+                payload = _encode(ranked[:count])
+            logger.warning(f"Região {self.path} cheia: publicadas {count} de {len(ranked)} oportunidades")
+
+        # Passa para o relógio de parede: time.monotonic() não é comparável entre processos
+        wall = math.nan if oldest_fetch is None else time.time() - (time.monotonic() - oldest_fetch)
+        self.version += 1
+        self.seq += 1
+        _SEQ.pack_into(self.mm, 0, self.seq)
+        end = HEADER.size + len(payload)
+        self.mm[HEADER.size:end] = payload
+        self.mm[end:end + len(metrics_payload)] = metrics_payload
+        HEADER.pack_into(self.mm, 0, self.seq, self.version, wall, len(payload), polls,
+                         len(metrics_payload))
+        self.seq += 1
+        _SEQ.pack_into(self.mm, 0, self.seq)
+        return self.version
+
+
+class ShardReader(_Region):
+    """Lê a região de um processo direto do mapeamento, sem cópia intermediária"""
+
+    def __init__(self, path: str, size: int, retries: int = 100):
+        super().__init__(path, size)
+        self.retries = retries
+
+    def read(self, known_version: int = 0) -> Optional[ShardData]:
+        """Nova publicação, ou None se a versão ainda é `known_version` (ou nada foi publicado)"""
+        mm = self.mm
+        for attempt in range(self.retries):
+            seq, version, wall, length, polls, metrics_length = HEADER.unpack_from(mm)
+            if seq & 1:
+                time.sleep(0 if attempt < 10 else 0.001)  # Escrita em andamento
+                continue
+            if version in (0, known_version):
+                if _SEQ.unpack_from(mm)[0] == seq:
+                    return None
+                continue
+            end = HEADER.size + min(length, self.capacity)
+            try:
+                with memoryview(mm)[HEADER.size:end] as view:
+                    rows = marshal.loads(view)
+                with memoryview(mm)[end:end + min(metrics_length, len(mm) - end)] as view:
+                    metrics = marshal.loads(view) if metrics_length else {}
+            except (ValueError, EOFError, TypeError):
+                rows = None  # Leitura rasgada; o seq abaixo confirma
+            if _SEQ.unpack_from(mm)[0] != seq or rows is None:
+                continue
+            now = time.monotonic()
+            oldest = None if math.isnan(wall) else now - (time.time() - wall)
+            return ShardData(version, _decode(rows), oldest, now, polls, metrics)
+        logger.warning(f"Região {self.path} não estabilizou após {self.retries} tentativas")
+        return None
+
+
+def run_worker(index: int, workers: int, path: str, log_level: Optional[int] = None) -> None:
+    """Ponto de entrada de um processo de varredura (shard `index` de `workers`)"""
+    from main import ArbitrageBot  # Importado aqui: main importa este módulo
+
+    if log_level is not None:
+        logging.getLogger().setLevel(log_level)  # Depois do basicConfig do main
+    try:
+        asyncio.run(_worker_loop(ArbitrageBot(shard=(index, workers)), index, workers, path))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(bot, index: int, workers: int, path: str) -> None:
+    scanner = bot.scanner
+    writer = ShardWriter(path)
+    parent = os.getppid()
+    # SIGTERM (stop() do processo principal) termina a varredura em andamento e sai
+    stopping = asyncio.Event()
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+    logger.info(f"Processo de varredura {index + 1}/{workers} iniciado")
+    try:
+        while not stopping.is_set() and os.getppid() == parent:  # Sai junto com o processo principal
+            try:
+                snapshot = await scanner.scan_once()
+                polls = sum(stats.polls for stats in scanner.scheduler.stats.values())
+                # As métricas de busca, cálculo, cache e cota deste processo vão junto
+                writer.publish(snapshot.opportunities, snapshot.oldest_fetch, polls, REGISTRY.state())
+            except Exception as e:
+                logger.error(f"Erro na varredura do shard {index}: {e}")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stopping.wait(), scanner.interval)
+    finally:
+        writer.close()
+        await bot.odds_client.close()
+
+
+class ShardedScanner(ArbitrageScanner):
+    """Varredura em vários processos, cada um com os esportes do seu shard
+
+    Cada processo roda o próprio ArbitrageBot (cliente, cache e motores) e publica suas
+    oportunidades e métricas numa região mapeada em memória; as métricas entram no
+    /metrics deste processo. Este lado só confere as versões a cada
+    `interval` segundos e junta os shards numa nova versão do SnapshotStore quando algum
+    mudou; alertas e cliques continuam passando pelo ArbitrageScanner.
+    """
+
+    def __init__(self, *args, workers: int = 2, region_bytes: int = 16 * 1024 * 1024,
+                 startup_timeout: float = 30.0, directory: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workers = max(1, workers)
+        self.region_bytes = region_bytes
+        self.startup_timeout = startup_timeout  # Espera pela primeira publicação de cada shard
+        self.directory = directory or shm_directory()
+        self.worker_log_level: Optional[int] = None
+        self._context = multiprocessing.get_context('spawn')
+        self._processes: List[Optional[multiprocessing.Process]] = []
+        self._readers: List[ShardReader] = []
+        self._shards: List[Optional[ShardData]] = []
+        self._metrics = RemoteMetrics()
+        self._stopping = False
+
+    def start(self) -> None:
+        self.start_workers()
+        super().start()
+
+    def start_workers(self) -> None:
+        """Cria as regiões e inicia os processos que ainda não estão rodando"""
+        self._stopping = False
+        if not self._readers:
+            removed = remove_stale_regions(self.directory)
+            if removed:
+                logger.warning(f"{removed} regiões órfãs de execuções anteriores removidas de {self.directory}")
+            region = next(_region_ids)
+            for index in range(self.workers):
+                path = os.path.join(self.directory, f"{REGION_PREFIX}{os.getpid()}-{region}-shard-{index}")
+                self._readers.append(ShardReader(path, self.region_bytes))
+                _regions_in_use.add(path)
+            self._processes = [None] * self.workers
+            self._shards = [None] * self.workers
+            logger.info(f"Varredura em {self.workers} processos (regiões em {self.directory})")
+
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                SCANNER_WORKER_RESTARTS.inc()
+                logger.warning(f"Processo de varredura {index} terminou (código {process.exitcode}); reiniciando")
+            process = self._context.Process(
+                target=run_worker, name=f"arbbot-shard-{index}", daemon=True,
+                args=(index, self.workers, self._readers[index].path, self.worker_log_level)
+            )
+            process.start()
+            self._processes[index] = process
+
+    async def stop(self) -> None:
+        self._stopping = True
+        await super().stop()
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                await asyncio.to_thread(process.join, 5)
+                if process.is_alive():
+                    process.kill()  # Varredura presa além do prazo
+                    await asyncio.to_thread(process.join)
+        for index, reader in enumerate(self._readers):
+            self._metrics.forget(index)
+            reader.close()
+            _regions_in_use.discard(reader.path)
+            try:
+                os.unlink(reader.path)
+            except FileNotFoundError:
+                pass
+        self._processes = []
+        self._readers = []
+        self._shards = []
+
+    def sports_count(self) -> int:
+        return int(SPORTS_ACTIVE.value)  # Soma dos esportes de todos os processos
+
+    def polls(self) -> int:
+        """Consultas à API feitas por todos os processos até a última leitura"""
+        return sum(shard.polls for shard in self._shards if shard is not None)
+
+    def _refresh(self) -> bool:
+        changed = False
+        now = time.monotonic()
+        for index, reader in enumerate(self._readers):
+            current = self._shards[index]
+            data = reader.read(current.version if current is not None else 0)
+            if data is not None:
+                self._shards[index] = current = data
+                self._metrics.apply(index, data.metrics)
+                changed = True
+            if current is not None:
+                SHARD_AGE_SECONDS.labels(str(index)).set(now - current.published_at)
+        return changed
+
+    async def _scan(self) -> OpportunitySnapshot:
+        if not self._stopping:
+            self.start_workers()
+
+        changed = self._refresh()
+        deadline = time.monotonic() + self.startup_timeout
+        while None in self._shards and time.monotonic() < deadline and self.store.latest is None:
+            await asyncio.sleep(0.05)
+            changed = self._refresh() or changed
+
+        latest = self.store.latest
+        if latest is not None and not changed:
+            return latest
+
+        shards = [shard for shard in self._shards if shard is not None]
+        opportunities = tuple(opp for shard in shards for opp in shard.opportunities)
+        fetched = [shard.oldest_fetch for shard in shards if shard.oldest_fetch is not None]
+        OPPORTUNITIES_CURRENT.set(len(opportunities))
+        return self.store.publish_compact(opportunities, min(fetched) if fetched else None)
@@ -0,0 +1,213 @@
+import heapq
+import itertools
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple, TypeVar
+
+from scheduler import parse_iso
+
+
+def _epoch(value: str) -> float:
+    moment = parse_iso(value)
+    return moment.timestamp() if moment is not None else 0.0
+
+
+class Bet(NamedTuple):
+    """Aposta de uma oportunidade (imutável, sem __dict__)"""
+    outcome: str
+    bookmaker: str
+    odds: float
+    stake: float
+    potential_return: float
+    bookmaker_key: str = ''
+    last_update: float = 0.0  # Epoch da cotação na casa (0 = desconhecido)
+
+    def age(self, now: Optional[float] = None) -> Optional[float]:
+        """Idade da cotação em segundos"""
+        if not self.last_update:
+            return None
+        return max(0.0, (time.time() if now is None else now) - self.last_update)
+
+
+class Opportunity(NamedTuple):
+    """Oportunidade de arbitragem compacta e imutável"""
+    event_id: str
+    game: str
+    sport: str
+    commence_time: str
+    profit_margin: float
+    total_stake: float
+    guaranteed_profit: float
+    bets: Tuple[Bet, ...]
+    sport_key: str = ''
+    market: str = 'h2h'
+    point: Optional[float] = None  # Linha do handicap (pelo mandante) ou do total
+
+    @classmethod
+    def from_dict(cls, opp: Dict) -> 'Opportunity':
+        """Converte o dicionário produzido pelos motores de cálculo"""
+        bets = tuple(
+            Bet(
+                outcome,
+                sys.intern(bet_info['bookmaker']),
+                bet_info['odds'],
+                bet_info['stake'],
+                bet_info['potential_return'],
+                sys.intern(bet_info.get('bookmaker_key', '')),
+                _epoch(bet_info.get('last_update', ''))
+            )
+            for outcome, bet_info in opp['bets'].items()
+        )
+        return cls(
+            opp.get('event_id', ''),
+            opp['game'],
+            sys.intern(opp['sport']),
+            opp.get('commence_time', ''),
+            opp['profit_margin'],
+            opp['total_stake'],
+            opp['guaranteed_profit'],
+            bets,
+            sys.intern(opp.get('sport_key', '')),
+            sys.intern(opp.get('market', 'h2h')),
+            opp.get('point')
+        )
+
+
+T = TypeVar('T')
+
+
+def _margin(opp: Opportunity) -> float:
+    return opp.profit_margin
+
+
+class RenderedOpportunity(NamedTuple):
+    """Trechos fixos da mensagem de uma oportunidade, montados uma vez por versão"""
+    emoji: str
+    summary: str  # Cabeçalho com o investimento base, até "COMO APOSTAR"
+    legs: Tuple[str, ...]  # Cada aposta com o valor base (sem a idade da cotação)
+    custom_summary: str  # Cabeçalho do cálculo com valor personalizado
+    leg_titles: Tuple[str, ...]
+    leg_odds: Tuple[str, ...]
+    leg_bookmakers: Tuple[str, ...]
+    odds: Tuple[float, ...]
+    fractions: Tuple[float, ...]  # Fração do investimento em cada aposta
+    last_updates: Tuple[float, ...]
+
+
+class OpportunitySnapshot:
+    """Resultado imutável de uma varredura, compartilhado por todos os usuários
+
+    As oportunidades ficam na ordem em que foram calculadas; a ordenação por margem é
+    feita sob demanda (top-K), só até a última página pedida.
+    """
+
+    __slots__ = ('id', 'created_at', 'oldest_fetch', 'opportunities', '_ranked', '_rendered')
+
+    def __init__(self, snapshot_id: int, opportunities: Tuple[Opportunity, ...],
+                 oldest_fetch: Optional[float] = None):
+        self.id = snapshot_id
+        self.created_at = time.monotonic()
+        self.oldest_fetch = oldest_fetch
+        self.opportunities = opportunities
+        self._ranked: Tuple[Opportunity, ...] = ()
+        self._rendered: Dict[Opportunity, object] = {}
+
+    def __len__(self) -> int:
+        return len(self.opportunities)
+
+    def top(self, count: int) -> Tuple[Opportunity, ...]:
+        """As `count` maiores margens, em ordem decrescente"""
+        total = len(self.opportunities)
+        if count > len(self._ranked) and len(self._ranked) < total:
+            if 4 * count >= total:
+                self._ranked = tuple(sorted(self.opportunities, key=_margin, reverse=True))
+            else:
+                # Amplia em dobro para que páginas seguidas não refaçam a seleção
+                wanted = max(count, 2 * len(self._ranked))
+                self._ranked = tuple(heapq.nlargest(wanted, self.opportunities, key=_margin))
+        return self._ranked[:count]
+
+    def page(self, number: int, size: int) -> Tuple[Opportunity, ...]:
+        """Página `number` (a partir de 0) do ranking"""
+        return self.top((number + 1) * size)[number * size:]
+
+    def pages(self, size: int) -> int:
+        return max(1, -(-len(self.opportunities) // size))
+
+    def render(self, opp: Opportunity, renderer: Callable[[Opportunity], T]) -> T:
+        """renderer(opp) feito uma única vez por versão e compartilhado entre os usuários"""
+        rendered = self._rendered.get(opp)
+        if rendered is None:
+            rendered = self._rendered[opp] = renderer(opp)
+        return rendered
+
+    @property
+    def data_age(self) -> float:
+        """Idade das odds mais antigas usadas na varredura"""
+        if self.oldest_fetch is None:
+            return 0.0
+        return max(0.0, time.monotonic() - self.oldest_fetch)
+
+
+class SnapshotStore:
+    """Armazena versões dos resultados; user_data guarda só o id da versão"""
+
+    def __init__(self, max_age: float = 3600.0):
+        self.max_age = max_age  # Versões mais antigas são descartadas mesmo se referenciadas
+        self.latest: Optional[OpportunitySnapshot] = None
+        self._snapshots: Dict[int, OpportunitySnapshot] = {}
+        self._refs: Counter = Counter()
+        self._holders: Dict[int, int] = {}  # usuário -> id da versão
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def publish(self, opportunities: Iterable[Dict],
+                oldest_fetch: Optional[float] = None) -> OpportunitySnapshot:
+        """Publica uma nova versão a partir das oportunidades calculadas"""
+        return self.publish_compact(tuple(Opportunity.from_dict(opp) for opp in opportunities), oldest_fetch)
+
+    def publish_compact(self, compact: Tuple[Opportunity, ...],
+                        oldest_fetch: Optional[float] = None) -> OpportunitySnapshot:
+        """Publica uma nova versão com oportunidades já compactas"""
+        with self._lock:
+            snapshot = OpportunitySnapshot(next(self._ids), compact, oldest_fetch)
+            self._snapshots[snapshot.id] = snapshot
+            self.latest = snapshot
+            self._evict()
+            return snapshot
+
+    def get(self, snapshot_id: Optional[int]) -> Optional[OpportunitySnapshot]:
+        return self._snapshots.get(snapshot_id)
+
+    def acquire(self, user_id: int, snapshot_id: int) -> None:
+        """Registra que o usuário está vendo esta versão (libera a anterior)"""
+        with self._lock:
+            previous = self._holders.get(user_id)
+            if previous == snapshot_id:
+                return
+            if previous in self._snapshots:
+                self._refs[previous] -= 1
+            self._holders[user_id] = snapshot_id
+            self._refs[snapshot_id] += 1
+            self._evict()
+
+    def release(self, user_id: int) -> None:
+        with self._lock:
+            previous = self._holders.pop(user_id, None)
+            if previous in self._snapshots:
+                self._refs[previous] -= 1
+                self._evict()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for snapshot_id, snapshot in list(self._snapshots.items()):
+            if snapshot is self.latest:
+                continue
+            if self._refs[snapshot_id] <= 0 or now - snapshot.created_at > self.max_age:
+                del self._snapshots[snapshot_id]
+                self._refs.pop(snapshot_id, None)
@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from arbitrage_engine import calculate_arbitrage_numpy, calculate_arbitrage_python
+from benchmarks.synthetic import generate_odds
+
+NOW = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize('seed', range(40))
+@pytest.mark.parametrize('outcomes', [2, 3])
+@pytest.mark.parametrize('max_leg_age', [None, 120.0])
+def test_numpy_engine_matches_python(seed, outcomes, max_leg_age):
+    payload = generate_odds(f'sport_{seed}', games=30, bookmakers=8, outcomes=outcomes,
+                            arbitrage_density=0.3, seed=seed, now=NOW,
+                            markets=('h2h', 'spreads', 'totals'))
+    now = NOW.timestamp()
+
+    expected = calculate_arbitrage_python(payload, 1.0, max_leg_age, now)
+    if max_leg_age is None:
+        assert expected  # O payload precisa ter arbitragens para a comparação valer
+    assert calculate_arbitrage_numpy(payload, 1.0, max_leg_age, now) == expected
+
+
+def test_engines_agree_on_empty_and_malformed_games():
+    payload = [{}, {'id': 'x', 'bookmakers': []}, {'id': 'y', 'bookmakers': [{'key': 'a', 'markets': []}]}]
+    assert calculate_arbitrage_numpy(payload, 1.0) == calculate_arbitrage_python(payload, 1.0) == []
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter
+
+from outbox import Outbox
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+def test_coalesced_edit_after_retry_after_gets_newest_result():
+    async def scenario():
+        outbox = Outbox()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def edit_a():
+            started.set()
+            await release.wait()
+            raise RetryAfter(0.05)
+
+        async def edit_b():
+            return 'ok2'
+
+        first = outbox.submit(1, edit_a, 'edit_message_text', key=('edit', 1))
+        await started.wait()
+        # A está em voo: B fica na fila com a mesma chave
+        second = outbox.submit(1, edit_b, 'edit_message_text', key=('edit', 1))
+        release.set()
+        try:
+            return await asyncio.gather(first, second)
+        finally:
+            await outbox.stop()
+
+    assert run(scenario()) == ['ok2', 'ok2']
+
+
+def test_retry_after_requeues_and_delivers():
+    async def scenario():
+        outbox = Outbox()
+        calls = []
+
+        async def send():
+            calls.append(None)
+            if len(calls) == 1:
+                raise RetryAfter(0.05)
+            return 'ok'
+
+        try:
+            return await outbox.submit(1, send, 'send_message'), len(calls), len(outbox)
+        finally:
+            await outbox.stop()
+
+    assert run(scenario()) == ('ok', 2, 0)
+
+
+def test_stop_cancels_in_flight_and_queued_sends():
+    async def scenario():
+        outbox = Outbox()
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        in_flight = outbox.submit(1, hang, 'send_message')
+        queued = outbox.submit(1, hang, 'send_message')
+        await started.wait()
+        await outbox.stop()
+        return in_flight, queued, len(outbox)
+
+    in_flight, queued, pending = run(scenario())
+    assert in_flight.cancelled()
+    assert queued.cancelled()
+    assert pending == 0
+
+
+def test_errors_reach_the_caller():
+    async def scenario():
+        outbox = Outbox()
+
+        async def fail():
+            raise ValueError('boom')
+
+        try:
+            await outbox.submit(1, fail, 'send_message')
+        finally:
+            await outbox.stop()
+
+    with pytest.raises(ValueError):
+        run(scenario())
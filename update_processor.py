@@ -0,0 +1,83 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import UPDATE_SECONDS, UPDATES_IN_FLIGHT
+
+
+class _UserQueue:
+    __slots__ = ('lock', 'pending')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processa updates de usuários diferentes em paralelo, mantendo a ordem de cada usuário
+
+    Updates do mesmo usuário passam por um Lock (FIFO) antes de ocupar uma vaga, então
+    o estado em user_data (ex.: waiting_for_amount) nunca é alterado por dois handlers
+    ao mesmo tempo, e um usuário com vários cliques na fila não prende vagas dos outros.
+    O limite do BaseUpdateProcessor vira o teto de updates aceitos (rodando + esperando).
+    """
+
+    def __init__(self, max_in_flight: int = 16, max_pending: int = 256):
+        super().__init__(max(max_pending, max_in_flight, 2))
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._users: Dict[Hashable, _UserQueue] = {}
+
+    @staticmethod
+    def user_key(update: object) -> Optional[Hashable]:
+        """Usuário (ou chat) dono do update; None para updates sem dono"""
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return ('chat', chat.id)
+        return None
+
+    async def initialize(self) -> None:
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+
+    async def shutdown(self) -> None:
+        self._users.clear()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self._slots is None:
+            await self.initialize()
+
+        started = time.perf_counter()
+        key = self.user_key(update)
+        if key is None:
+            await self._run(coroutine, started)
+            return
+
+        queue = self._users.get(key)
+        if queue is None:
+            queue = self._users[key] = _UserQueue()
+        queue.pending += 1
+        try:
+            async with queue.lock:
+                await self._run(coroutine, started)
+        finally:
+            queue.pending -= 1
+            if queue.pending == 0:
+                del self._users[key]
+
+    async def _run(self, coroutine: Awaitable[Any], started: float) -> None:
+        async with self._slots:
+            self.in_flight += 1
+            UPDATES_IN_FLIGHT.set(self.in_flight)
+            try:
+                await coroutine
+            finally:
+                self.in_flight -= 1
+                UPDATES_IN_FLIGHT.set(self.in_flight)
+                # Inclui a espera pela vez do usuário e por uma vaga livre
+                UPDATE_SECONDS.observe(time.perf_counter() - started)
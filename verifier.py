@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence
+
+from metrics import VERIFY_SECONDS, VERIFY_RESULTS
+from odds_client import CreditsExhausted, OddsClient
+from scheduler import SportScheduler
+from snapshots import Opportunity
+
+logger = logging.getLogger(__name__)
+
+
+class Verification(NamedTuple):
+    """Resultado da reconferência de uma oportunidade"""
+    original: Opportunity
+    opportunity: Optional[Opportunity]  # None se a arbitragem sumiu
+    status: str  # 'confirmed', 'gone' ou 'unverified'
+    latency: Optional[float]  # Segundos gastos na consulta (None se veio do cache)
+    checked_at: float  # time.monotonic() da consulta
+
+    @property
+    def current(self) -> Optional[Opportunity]:
+        """Oportunidade a exibir: a reconferida, ou a original se não deu para conferir"""
+        if self.status == 'unverified':
+            return self.original
+        return self.opportunity
+
+
+class OpportunityVerifier:
+    """Reconfere só as casas envolvidas pelo endpoint de odds por evento antes de exibir"""
+
+    def __init__(
+        self,
+        odds_client: OddsClient,
+        engine: Callable[..., List[Dict]],
+        min_profit_margin: float,
+        max_leg_age: Optional[float] = None,
+        ttl: float = 15.0,
+        budget: float = 5.0,
+        scheduler: Optional[SportScheduler] = None,
+    ):
+        self.odds_client = odds_client
+        self.engine = engine
+        self.min_profit_margin = min_profit_margin
+        self.max_leg_age = max_leg_age
+        self.ttl = ttl  # Reconferências recentes são reaproveitadas por outros usuários
+        self.budget = budget  # Tempo máximo de espera por uma reconferência
+        self.scheduler = scheduler  # Créditos das consultas saem do mesmo orçamento da varredura
+        self._results: Dict[Hashable, Verification] = {}
+
+    @staticmethod
+    def key(opp: Opportunity) -> Hashable:
+        legs = tuple(sorted((bet.outcome, bet.bookmaker_key or bet.bookmaker) for bet in opp.bets))
+        return (opp.event_id, opp.market, opp.point, legs)
+
+    def cached(self, opp: Opportunity) -> Optional[Verification]:
+        """Última reconferência ainda válida, sem consultar a API"""
+        result = self._results.get(self.key(opp))
+        if result is None or time.monotonic() - result.checked_at > self.ttl:
+            return None
+        return result
+
+    async def verify(self, opp: Opportunity) -> Verification:
+        """Busca de novo as odds das casas da oportunidade e recalcula a arbitragem"""
+        result = self.cached(opp)
+        if result is not None:
+            return result
+
+        bookmakers = [bet.bookmaker_key for bet in opp.bets if bet.bookmaker_key]
+        if not opp.event_id or not opp.sport_key or len(bookmakers) < len(opp.bets):
+            return Verification(opp, None, 'unverified', None, time.monotonic())
+
+        fetched = False
+
+        def spend(credits: int) -> bool:
+            nonlocal fetched
+            fetched = True
+            return self.scheduler is None or self.scheduler.spend(credits)
+
+        started = time.perf_counter()
+        try:
+            event = await asyncio.wait_for(
+                self.odds_client.get_event_odds(opp.sport_key, opp.event_id, bookmakers,
+                                                markets=opp.market, ttl=self.ttl, spend=spend),
+                timeout=self.budget
+            )
+        except CreditsExhausted:
+            logger.debug(f"Sem créditos para reconferir {opp.game}")
+            VERIFY_RESULTS.labels('unverified').inc()
+            return Verification(opp, None, 'unverified', None, time.monotonic())
+        except Exception as e:
+            logger.warning(f"Não foi possível reconferir {opp.game}: {e!r}")
+            VERIFY_RESULTS.labels('unverified').inc()
+            return Verification(opp, None, 'unverified', None, time.monotonic())
+        latency = None
+        if fetched:
+            latency = time.perf_counter() - started
+            VERIFY_SECONDS.observe(latency)
+
+        verified = None
+        if event is not None:
+            allowed = set(bookmakers)
+            event = {
+                **event,
+                'bookmakers': [b for b in event.get('bookmakers', []) if b.get('key') in allowed]
+            }
+            for found in self.engine([event], self.min_profit_margin, self.max_leg_age):
+                if found['market'] == opp.market and found['point'] == opp.point:
+                    verified = Opportunity.from_dict(found)
+                    break
+
+        status = 'confirmed' if verified is not None else 'gone'
+        VERIFY_RESULTS.labels(status).inc()
+        result = Verification(opp, verified, status, latency, time.monotonic())
+        self._remember(opp, result)
+        return result
+
+    async def verify_many(self, opportunities: Sequence[Opportunity]) -> List[Verification]:
+        """Reconfere várias oportunidades em paralelo"""
+        return list(await asyncio.gather(*(self.verify(opp) for opp in opportunities)))
+
+    def _remember(self, opp: Opportunity, result: Verification) -> None:
+        now = time.monotonic()
+        self._results = {
+            key: value for key, value in self._results.items() if now - value.checked_at <= self.ttl
+        }
+        self._results[self.key(opp)] = result